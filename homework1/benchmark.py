@@ -0,0 +1,114 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from zipfile import ZipFile
+from main import App, Node
+
+
+class DictNode:
+    # Узел прежнего дерева: __dict__ у каждого экземпляра
+    def __init__(self, name, is_dir=False):
+        self.name = name
+        self.is_dir = is_dir
+        self.children = {}
+        self.info = None
+        self.loaded = True
+
+    def add_child(self, child_node):
+        self.children[child_node.name] = child_node
+
+    def get_child(self, name):
+        return self.children.get(name)
+
+    def has_children(self):
+        return bool(self.children)
+
+
+class HeadlessApp(App):
+    # Всё, что происходит до появления окна; само окно без дисплея не создать
+    def _gui_setup(self):
+        pass
+
+
+class ZipOnlyApp(HeadlessApp):
+    # Нижняя граница: только чтение центрального каталога модулем zipfile
+    def _build_tree(self):
+        root = Node("/", is_dir=True)
+        root.loaded = True
+        return root
+
+
+class EagerApp(HeadlessApp):
+    def _build_tree(self):
+        # Прежнее построение: узел на каждую часть каждого пути при запуске
+        root = DictNode("/", is_dir=True)
+        for info in self.fs.infolist():
+            parts = info.filename.strip("/").split("/")
+            current_node = root
+            for idx, part in enumerate(parts):
+                is_dir = (idx != len(parts) - 1) or info.is_dir()
+                if part not in current_node.children:
+                    current_node.add_child(DictNode(part, is_dir=is_dir))
+                current_node = current_node.get_child(part)
+            current_node.info = info
+        return root
+
+
+APPS = {"zipfile": ZipOnlyApp, "eager": EagerApp, "lazy": HeadlessApp}
+
+
+def make_archive(path, count):
+    with ZipFile(path, "w") as fs:
+        for i in range(count):
+            fs.writestr(f"dir{i % 100}/sub{i % 10000}/file{i}.txt", "")
+
+
+def write_config(path, archive):
+    with open(path, "w") as f:
+        f.write(f'<settings><setting name="file_system_path">{archive}</setting>'
+                f'<setting name="username">bench</setting></settings>')
+
+
+def measure(mode, config_path):
+    # Время до первого приглашения: открытие архива, дерево и первый ls
+    start = time.perf_counter()
+    app = APPS[mode](config_path)
+    app._ls_cmd([])
+    elapsed = time.perf_counter() - start
+    return {"seconds": elapsed, "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+
+
+def run(count):
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = os.path.join(tmp, "fs.zip")
+        config_path = os.path.join(tmp, "config.xml")
+        make_archive(archive, count)
+        write_config(config_path, archive)
+        print(f"{count} entries")
+        print(f"{'mode':>8} {'seconds':>8} {'RSS MB':>8}")
+        for mode in APPS:
+            # Каждый замер — в отдельном процессе, чтобы пиковый RSS не смешивался
+            output = subprocess.run([sys.executable, __file__, "--measure", mode, config_path],
+                                    capture_output=True, text=True, check=True).stdout
+            result = json.loads(output)
+            print(f"{mode:>8} {result['seconds']:>8.3f} {result['rss_mb']:>8.1f}")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Shell startup benchmark on a generated archive")
+    arg_parser.add_argument("count", nargs="?", type=int, default=500000, help="number of archive entries")
+    arg_parser.add_argument("--measure", nargs=2, metavar=("MODE", "CONFIG"), help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+    if args.measure:
+        print(json.dumps(measure(*args.measure)))
+        return
+    run(args.count)
+
+
+if __name__ == "__main__":
+    main()
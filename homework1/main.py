@@ -1,17 +1,163 @@
+import codecs
+import threading
 import tkinter as tk
 import xml.etree.ElementTree as ET
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
 from zipfile import ZipFile
 from pathlib import Path
 import re
 
+# Сколько строк длинного вывода вставляется в окно за один проход цикла событий
+OUTPUT_CHUNK = 500
+# Более длинный текст тоже выводится порциями строк
+OUTPUT_SIZE = 1 << 16
+# Команды с вводом-выводом архива выполняются в рабочем потоке
+BACKGROUND_COMMANDS = ("cat", "touch")
+# Период опроса рабочего потока из цикла событий, мс — меньше кадра
+POLL_INTERVAL = 10
+READ_BLOCK = 1 << 16
+# Сколько распакованных блоков держит кэш cat (по READ_BLOCK байт)
+CACHE_BLOCKS = 256
+CAT_USAGE = "usage: cat [--head N] [--tail N] [--bytes START:END] path"
+
+
+class PartialLine(str):
+    # Кусок строки длиннее блока: перевод строки после него не ставится
+    pass
+
+
+def take_page(lines) -> list:
+    # Порция вывода: не больше OUTPUT_CHUNK строк и примерно OUTPUT_SIZE символов
+    page, size = [], 0
+    for line in lines:
+        page.append(line)
+        size += len(line)
+        if len(page) == OUTPUT_CHUNK or size >= OUTPUT_SIZE:
+            break
+    return page
+
+
+def join_lines(lines, partial: bool = False):
+    # Перевод строки ставится перед каждой строкой, кроме продолжения частичной
+    parts = []
+    for line in lines:
+        if not partial:
+            parts.append("\n")
+        parts.append(line)
+        partial = type(line) is PartialLine
+    return "".join(parts), partial
+
+
+def head_lines(lines, count: int):
+    # Первые count строк; частичные куски строкой не считаются
+    if count <= 0:
+        return
+    for line in lines:
+        yield line
+        if type(line) is not PartialLine:
+            count -= 1
+            if not count:
+                return
+
+
+def split_lines(text: str):
+    # Строки длинного текста по одной, без разбиения всего текста сразу
+    start = 0
+    while (end := text.find("\n", start)) != -1:
+        yield text[start:end]
+        start = end + 1
+    yield text[start:]
+
+
+class Cancelled(Exception):
+    pass
+
+
+class BlockCache:
+    # LRU распакованных блоков членов архива: (смещение записи, номер блока) -> bytes.
+    # Поток последнего читаемого члена остаётся открытым, поэтому следующий
+    # блок распаковывается с места остановки, а не с начала файла
+    def __init__(self, fs, cancelled, block_size=READ_BLOCK, capacity=CACHE_BLOCKS):
+        self.fs = fs
+        self.cancelled = cancelled
+        self.block_size = block_size
+        self.capacity = capacity
+        self.blocks = OrderedDict()
+        self.stream = None
+        self.stream_key = None
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+            self.stream_key = None
+
+    def block(self, info, index: int) -> bytes:
+        key = (info.header_offset, index)
+        data = self.blocks.get(key)
+        if data is not None:
+            self.blocks.move_to_end(key)
+            return data
+        if self.stream_key != info.header_offset or self.stream.tell() > index * self.block_size:
+            self.close()
+            self.stream = self.fs.open(info)
+            self.stream_key = info.header_offset
+        # Сквозное чтение до нужного блока; пройденные блоки тоже попадают в кэш
+        while True:
+            if self.cancelled.is_set():
+                raise Cancelled
+            current = self.stream.tell() // self.block_size
+            data = self.stream.read(self.block_size)
+            self.blocks[(info.header_offset, current)] = data
+            if len(self.blocks) > self.capacity:
+                self.blocks.popitem(last=False)
+            if current >= index or len(data) < self.block_size:
+                return data if current == index else b""
+
+    def read(self, info, start: int, end: int):
+        # Байты [start, end) члена архива кусками не больше блока
+        size = self.block_size
+        while start < end:
+            if self.cancelled.is_set():
+                raise Cancelled
+            data = self.block(info, start // size)
+            chunk = data[start % size:min(len(data), end - start // size * size)]
+            if not chunk:
+                return
+            yield chunk
+            start += len(chunk)
+
+    def tail_offset(self, info, start: int, end: int, count: int) -> int:
+        # Начало последних count строк: блоки просматриваются от конца к началу
+        if count <= 0 or start >= end:
+            return end
+        size = self.block_size
+        need = count + (self.block(info, (end - 1) // size)[(end - 1) % size:(end - 1) % size + 1] == b"\n")
+        for index in range((end - 1) // size, start // size - 1, -1):
+            lo = max(start, index * size)
+            data = self.block(info, index)[lo - index * size:end - index * size]
+            pos = len(data)
+            while (pos := data.rfind(b"\n", 0, pos)) != -1:
+                need -= 1
+                if not need:
+                    return lo + pos + 1
+        return start
+
 
 class Node:
     
+    __slots__ = ("name", "is_dir", "children", "info", "path", "loaded")
     
-    def __init__(self, name: str, is_dir: bool = False):
+    def __init__(self, name: str, is_dir: bool = False, info=None, path: str = ""):
         self.name = name  
         self.is_dir = is_dir  
         self.children = {}  
+        self.info = info  # ZipInfo записи архива; у неявных каталогов None
+        self.path = path  # Полный путь от корня без начального "/"
+        self.loaded = False  # Прочитаны ли дети каталога из архива
 
     def add_child(self, child_node):
         
@@ -30,14 +176,23 @@ class App:
     
     
     cur_dir: str = "/"  
+    output = None  # Итератор строк вывода, который ещё вставляется в окно
+    partial = False  # Закончилась ли последняя вставленная порция частичной строкой
+    task = None  # Future команды, выполняемой в рабочем потоке
     
     def __init__(self, config_path: str) -> None:
+        # Один рабочий поток: операции с ZipFile выполняются по очереди
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.cancelled = threading.Event()
         self._load_config(config_path)  
         self._open_fs()  
+        self.cache = BlockCache(self.fs, self.cancelled)
         self.root_node = self._build_tree()  
         self._gui_setup()  
 
     def __del__(self) -> None:
+        self.executor.shutdown(wait=True)  # Дожидаемся записи в архив
+        self.cache.close()
         if self.fs:  # Проверяем, что Zip открыт
             self.fs.close()
 
@@ -46,41 +201,119 @@ class App:
         self.fs = ZipFile(Path(self.config["file_system_path"]).absolute(), 'a')
 
     def _build_tree(self) -> Node:
+        # Центральный каталог один раз раскладывается в отсортированные массивы
+        # имён и ZipInfo; узлы создаются, только когда команда доходит до каталога
+        infos = [info for info in self.fs.infolist() if info.filename.strip("/")]
+        infos.sort(key=lambda info: info.filename.strip("/"))
+        self.infos = infos
+        self.names = [info.filename.strip("/") for info in infos]
+        return Node("/", is_dir=True)
+
+    def _load(self, node: Node) -> None:
+        # Дети каталога — записи с префиксом его пути; потомки вложенных
+        # каталогов пропускаются двоичным поиском
+        if node.loaded or not node.is_dir:
+            return
+        node.loaded = True
+        names = self.names
+        prefix = node.path + "/" if node.path else ""
+        idx = bisect_left(names, prefix)
+        while idx < len(names) and names[idx].startswith(prefix):
+            part, sep, _ = names[idx][len(prefix):].partition("/")
+            child = node.get_child(part)
+            if child is None:
+                child = Node(part, is_dir=bool(sep), path=prefix + part)
+                node.add_child(child)
+            if sep:
+                child.is_dir = True
+                # "0" — следующий символ после "/"
+                idx = bisect_left(names, prefix + part + "0", idx)
+            else:
+                child.info = self.infos[idx]
+                child.is_dir = child.is_dir or child.info.is_dir()
+                idx += 1
+
+    def _add_to_tree(self, info) -> None:
         
-        root = Node("/", is_dir=True)  
-        file_list = self.fs.namelist()  
-
-        for file_path in file_list:
-            parts = file_path.strip("/").split("/")  
-            current_node = root  
-
-            for idx, part in enumerate(parts):
-                is_dir = (idx != len(parts) - 1)  
-                if part not in current_node.children:
-                    new_node = Node(part, is_dir=is_dir)
-                    current_node.add_child(new_node)
-                current_node = current_node.get_child(part)
+        path = info.filename.strip("/")
+        idx = bisect_right(self.names, path)
+        self.names.insert(idx, path)
+        self.infos.insert(idx, info)
 
-        return root
-
-    def _dfs_tree(self, node: Node, prefix: str = "") -> str:
-        
-        tree_str = f"{prefix}{node.name}/\n" if node.is_dir else f"{prefix}{node.name}\n"
-        
-        sorted_children = sorted(node.children.values(), key=lambda n: (not n.is_dir, n.name))
-        for idx, child in enumerate(sorted_children):
-            connector = "|__ " if idx == len(sorted_children) - 1 else "|-- "
-            tree_str += self._dfs_tree(child, prefix + (connector if idx == len(sorted_children) - 1 else "│   "))
+        # В уже прочитанные каталоги запись добавляется сразу, остальные прочитают её из массивов
+        parts = path.split("/")
+        current_node = self.root_node
+        for idx, part in enumerate(parts):
+            if not current_node.loaded:
+                return
+            child = current_node.get_child(part)
+            if child is None:
+                is_dir = (idx != len(parts) - 1)
+                child = Node(part, is_dir, None if is_dir else info, "/".join(parts[:idx + 1]))
+                current_node.add_child(child)
+            current_node = child
+
+    def _resolve(self, path: str) -> list:
+        # Путь относительно текущего каталога с учётом "." и ".." -> части от корня
+        parts = [] if path.startswith("/") else [part for part in self.cur_dir.split("/") if part]
+        for part in path.split("/"):
+            if part == "..":
+                if parts:
+                    parts.pop()
+            elif part and part != ".":
+                parts.append(part)
+        return parts
+
+    def _sorted_children(self, node: Node) -> list:
         
-        return tree_str
+        self._load(node)
+        return sorted(node.children.values(), key=lambda n: (not n.is_dir, n.name))
+
+    def _walk_tree(self, node: Node, max_depth=None, max_entries=None):
+        # Обход в глубину со стеком (дети, номер следующего, префикс) вместо рекурсии;
+        # строки отдаются по одной, дети каталога сортируются при входе в него
+        yield f"{node.name}/" if node.is_dir else node.name
+        if not node.is_dir or max_depth == 0:
+            return
+        stack = [(self._sorted_children(node), 0, "")]
+        count = 0
+        while stack:
+            children, idx, prefix = stack.pop()
+            if idx == len(children):
+                continue
+            stack.append((children, idx + 1, prefix))
+            if count == max_entries:
+                yield f"... (output limited to {max_entries} entries)"
+                return
+            count += 1
+            child = children[idx]
+            child_prefix = prefix + ("|__ " if idx == len(children) - 1 else "│   ")
+            yield f"{child_prefix}{child.name}/" if child.is_dir else f"{child_prefix}{child.name}"
+            if child.is_dir and (max_depth is None or len(stack) < max_depth):
+                stack.append((self._sorted_children(child), 0, child_prefix))
+
+    def _tree_lines(self, arg: list):
+        # tree [-L глубина] [--max-entries N] [путь]
+        path, max_depth, max_entries = ".", None, None
+        args = iter(arg or [])
+        try:
+            for item in args:
+                if item == "-L":
+                    max_depth = int(next(args))
+                elif item == "--max-entries":
+                    max_entries = int(next(args))
+                else:
+                    path = item
+        except (StopIteration, ValueError):
+            return iter(["usage: tree [-L depth] [--max-entries N] [path]"])
+        node = self._find_node_by_path(self._resolve(path))
+        if node:
+            return self._walk_tree(node, max_depth, max_entries)
+        return iter(["Directory not found."])
 
     def _tree_cmd(self, arg: list) -> str:
         
-        path = self.cur_dir if not arg else arg[0]
-        node = self._find_node_by_path(path.strip("/").split("/"))
-        if node:
-            return self._dfs_tree(node)
-        return "Directory not found."
+        return "".join(f"{line}\n" for line in self._tree_lines(arg))
 
     def _find_node_by_path(self, parts: list) -> Node:
         
@@ -88,6 +321,7 @@ class App:
         for part in parts:
             if not part:  
                 continue
+            self._load(current_node)
             current_node = current_node.get_child(part)
             if not current_node:
                 return None
@@ -97,19 +331,11 @@ class App:
         if not arg:
             return ""
 
-        if arg[0] == "/":
-            # Переход в корень
-            self.cur_dir = "/"
-        
-        elif arg[0] == "..":
-            # Переход на уровень выше
-            if self.cur_dir != "/":
-                # Убираем последний каталог из пути
-                self.cur_dir = "/".join(self.cur_dir.rstrip("/").split("/")[:-1]) or "/"
-        
-        elif arg[0] in self.fs.namelist():
-            # Переход в указанную директорию, если она существует
-            self.cur_dir = arg[0]
+        parts = self._resolve(arg[0])
+        node = self._find_node_by_path(parts)
+        if node and node.is_dir:
+            # Текущий каталог хранится как имя записи каталога в архиве, корень — "/"
+            self.cur_dir = "/".join(parts) + "/" if parts else "/"
 
         return ""
 
@@ -117,33 +343,19 @@ class App:
     def _touch_cmd(self, arg: list) -> str:
         
         if not arg: return ""
-        file_name = arg[0].strip("/")
-        if not file_name.startswith(self.cur_dir):
-            file_path = f"{self.cur_dir.rstrip('/')}/{file_name}"
-            file_path = file_path.lstrip('/')
-        
-        if file_path in self.fs.namelist():
+        parts = self._resolve(arg[0])
+        if not parts or self._find_node_by_path(parts):
             return ""
+        file_path = "/".join(parts)
         self.fs.writestr(file_path, "some text here")  
-        self._add_file_to_tree(file_path)  
+        self._add_to_tree(self.fs.getinfo(file_path))  
         return ""
 
-    def _add_file_to_tree(self, file_path: str) -> None:
-        
-        parts = file_path.strip("/").split("/")
-        current_node = self.root_node
-
-        for idx, part in enumerate(parts):
-            is_dir = (idx != len(parts) - 1)
-            if part not in current_node.children:
-                new_node = Node(part, is_dir=is_dir)
-                current_node.add_child(new_node)
-            current_node = current_node.get_child(part)
-
     def _ls_cmd(self, arg: list) -> str:
         
-        path = self.cur_dir if not arg else arg[0]
-        node = self._find_node_by_path(path.strip("/").split("/"))
+        node = self._find_node_by_path(self._resolve(arg[0] if arg else "."))
+        if node:
+            self._load(node)
         
         if node and node.has_children():
             return '\n'.join(sorted(node.children.keys()))
@@ -160,10 +372,58 @@ class App:
         exit(0)
 
     def _cat_cmd(self, arg: list):
+        # cat [--head N] [--tail N] [--bytes START:END] путь; член архива читается
+        # потоком через кэш блоков, длинный вывод отдаётся итератором строк
+        if not arg: return ""
+        path, head, tail, start, end = None, None, None, 0, None
+        args = iter(arg)
+        try:
+            for item in args:
+                if item == "--head":
+                    head = int(next(args))
+                elif item == "--tail":
+                    tail = int(next(args))
+                elif item == "--bytes":
+                    first, _, last = next(args).partition(":")
+                    start, end = int(first or 0), int(last) if last else None
+                else:
+                    path = item
+        except (StopIteration, ValueError):
+            return CAT_USAGE
+        if path is None: return CAT_USAGE
+        node = self._find_node_by_path(self._resolve(path))
+        if node is None or node.is_dir or node.info is None: return ""
+
+        info = node.info
+        end = info.file_size if end is None else min(end, info.file_size)
+        try:
+            if tail is not None:
+                start = self.cache.tail_offset(info, start, end, tail)
+            lines = self._member_lines(info, start, end)
+            if head is not None:
+                lines = head_lines(lines, head)
+            # Первая порция читается сразу (в рабочем потоке), остальные — при выводе
+            first = take_page(lines)
+        except Cancelled:
+            return ""
+        if len(first) < OUTPUT_CHUNK and sum(map(len, first)) < OUTPUT_SIZE:
+            return join_lines(first)[0][1:]
+        return chain(first, lines)
+
+    def _member_lines(self, info, start: int, end: int):
         
-        if not arg or arg[0].lstrip("/") not in self.fs.namelist(): return ""
-        text = self.fs.read(arg[0]).decode("utf-8")
-        return text
+        # Незаконченная строка копится не дольше блока, затем выдаётся частичной,
+        # поэтому файл без переводов строк читается за линейное время
+        decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        rest = ""
+        for chunk in self.cache.read(info, start, end):
+            lines = (rest + decoder.decode(chunk)).split("\n")
+            rest = lines.pop()
+            yield from lines
+            if len(rest) >= self.cache.block_size:
+                yield PartialLine(rest)
+                rest = ""
+        yield rest + decoder.decode(b"", final=True)
 
     def _echo_cmd(self, arg: list):
         
@@ -188,16 +448,79 @@ class App:
         self.text_field.pack(pady=10)
         self.button.pack(pady=5)
         self.text_field.bind("<Return>", self._enter_handler)
+        self.text_field.bind("<Control-c>", self._cancel_handler)
         self.text_field.insert("1.0", f"Hello {self.config['username']}!\n{self.cur_dir} > ")
 
     def _enter_handler(self, event=None) -> str:
         
+        if self.output is not None or self.task is not None:
+            return "break"
         src_line = self.text_field.get("1.0", tk.END)
         lines = src_line.strip().split("\n")
         self._cmd_exec(lines[-1].split())
-        self.text_field.insert(tk.END, f"\n{self.cur_dir} > ")
+        if self.output is None and self.task is None:
+            self._show_prompt()
+        return "break"
+
+    def _cancel_handler(self, event=None):
+        # Без выполняющейся команды Ctrl-C остаётся копированием текста
+        if self.output is None and self.task is None:
+            return None
+        self.cancelled.set()
         return "break"
 
+    def _poll_task(self) -> None:
+        # Результат рабочего потока забирается в главном потоке: Tk однопоточный.
+        # Задача — либо сама команда, либо следующая порция её вывода
+        if not self.task.done():
+            self.root.after(POLL_INTERVAL, self._poll_task)
+            return
+        task, self.task = self.task, None
+        if self.cancelled.is_set():
+            self.output = None
+            self.text_field.insert(tk.END, "\n^C")
+        elif task.exception() is not None:
+            self.output = None
+            self.text_field.insert(tk.END, f"\n{task.exception()}")
+        elif self.output is not None:
+            self._show_page(task.result())
+        else:
+            self._show_result(task.result())
+        if self.output is None and self.task is None:
+            self._show_prompt()
+
+    def _show_result(self, res) -> None:
+        
+        if isinstance(res, str) and len(res) < OUTPUT_SIZE:
+            self.text_field.insert(tk.END, f"\n{res}")
+        else:
+            if isinstance(res, str):
+                res = split_lines(res)
+            # Длинный вывод читается порциями в рабочем потоке и вставляется
+            # из цикла событий Tk, между порциями окно обрабатывает события
+            self.output = res
+            self.partial = False
+            self._fetch_page()
+
+    def _fetch_page(self) -> None:
+        
+        self.task = self.executor.submit(take_page, self.output)
+        self.root.after(1, self._poll_task)
+
+    def _show_page(self, page: list) -> None:
+        
+        if not page:
+            self.output = None
+            return
+        text, self.partial = join_lines(page, self.partial)
+        self.text_field.insert(tk.END, text)
+        self.text_field.see(tk.END)
+        self._fetch_page()
+
+    def _show_prompt(self) -> None:
+        
+        self.text_field.insert(tk.END, f"\n{self.cur_dir} > ")
+
     def _cmd_exec(self, lines: list[str]) -> bool:
         
         commands = {
@@ -208,14 +531,19 @@ class App:
             "cat": self._cat_cmd,
             "touch": self._touch_cmd,
             "echo": self._echo_cmd,
-            "tree": self._tree_cmd
+            "tree": self._tree_lines
         }
         if len(lines) < 3:
             return False
         cmd = lines[2]
         if cmd in commands:
-            res = commands[cmd](lines[3:])
-            self.text_field.insert(tk.END, f"\n{res}")
+            self.cancelled.clear()
+            if cmd in BACKGROUND_COMMANDS:
+                # Окно не блокируется: ввод ждёт завершения, Ctrl-C отменяет команду
+                self.task = self.executor.submit(commands[cmd], lines[3:])
+                self.root.after(POLL_INTERVAL, self._poll_task)
+            else:
+                self._show_result(commands[cmd](lines[3:]))
             return True
         return False
 
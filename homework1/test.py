@@ -1,8 +1,9 @@
 import unittest
 from pathlib import Path
-from zipfile import ZipFile
+from zipfile import ZipFile, ZipInfo
 import os
-from main import App, Node  
+import threading
+from main import App, BlockCache, Node, PartialLine  
 
 
 class TestApp(unittest.TestCase):
@@ -51,12 +52,82 @@ class TestApp(unittest.TestCase):
         self.app._cd_cmd(["/"])  
         self.assertEqual(self.app.cur_dir, "/")  
 
+    def test_cd_relative(self):
+        
+        self.app._cd_cmd(["dir1"])  
+        self.app._cd_cmd(["./../dir2/."])  
+        self.assertEqual(self.app.cur_dir, "dir2/")  
+        self.app._cd_cmd(["file2.txt"])  
+        self.assertEqual(self.app.cur_dir, "dir2/")  
+        self.app._cd_cmd([".."])  
+        self.assertEqual(self.app.cur_dir, "/")  
+
+    def test_cat_relative(self):
+        
+        self.app._cd_cmd(["dir2"])  
+        content = self.app._cat_cmd(["../dir1/file1.txt"])  
+        self.app._cd_cmd(["/"])  
+        self.assertEqual(content, "Content of file1")
+
+    def test_lazy_tree(self):
+        
+        node = Node("dir", is_dir=True)  
+        self.assertFalse(hasattr(node, "__dict__"))  
+        self.app._touch_cmd(["/dir3/file4.txt"])  
+        dir3 = self.app.root_node.get_child("dir3")  
+        self.assertFalse(dir3.loaded)  
+        self.assertEqual(self.app._ls_cmd(["dir3"]), "file4.txt")  
+        self.assertTrue(dir3.loaded)  
+
     def test_touch_cmd(self):
         
         self.app._touch_cmd(["newfile.txt"])  
         self.assertIn("newfile.txt", self.app.fs.namelist())  
         self.app.__del__()
 
+    def test_cat_background(self):
+        
+        self.app._cmd_exec(["/", ">", "cat", "dir1/file1.txt"])  
+        task, self.app.task = self.app.task, None
+        self.assertEqual(task.result(), "Content of file1")
+
+    def test_cat_cancelled(self):
+        
+        self.app.cancelled.set()
+        content = self.app._cat_cmd(["dir1/file1.txt"])  
+        self.app.cancelled.clear()
+        self.assertEqual(content, "")
+
+    def test_cat_ranges(self):
+        
+        self.assertEqual(self.app._cat_cmd(["--head", "1", "dir1/file1.txt"]), "Content of file1")
+        self.assertEqual(self.app._cat_cmd(["--tail", "1", "dir1/file1.txt"]), "Content of file1")
+        self.assertEqual(self.app._cat_cmd(["--bytes", "0:7", "dir1/file1.txt"]), "Content")
+        self.assertEqual(self.app._cat_cmd(["--bytes", "11:", "dir1/file1.txt"]), "file1")
+        self.assertTrue(self.app._cat_cmd(["--head"]).startswith("usage"))
+
+    def test_block_cache(self):
+        
+        info = self.app.fs.getinfo("dir2/file2.txt")
+        cache = BlockCache(self.app.fs, threading.Event(), block_size=4, capacity=2)
+        self.assertEqual(b"".join(cache.read(info, 0, info.file_size)), b"Content of file2")
+        self.assertEqual(len(cache.blocks), 2)  
+        self.assertEqual(cache.tail_offset(info, 0, info.file_size, 1), 0)
+        cache.close()
+        # После close тот же файл открывается заново
+        cache.blocks.clear()
+        self.assertEqual(cache.block(info, 0), b"Cont")
+        cache.close()
+
+    def test_cat_long_line(self):
+        
+        cache, self.app.cache = self.app.cache, BlockCache(self.app.fs, self.app.cancelled, block_size=4)
+        lines = list(self.app._member_lines(self.app.fs.getinfo("dir1/file1.txt"), 0, 16))
+        content = self.app._cat_cmd(["dir1/file1.txt"])  
+        self.app.cache = cache
+        self.assertIsInstance(lines[0], PartialLine)
+        self.assertEqual(content, "Content of file1")
+
     def test_cat_cmd(self):
         
         content = self.app._cat_cmd(["dir1/file1.txt"])  
@@ -69,6 +140,21 @@ class TestApp(unittest.TestCase):
         self.assertIn("file1.txt", tree_output)
         self.assertIn("file3.txt", tree_output)
 
+    def test_tree_limits(self):
+        
+        tree_output = self.app._tree_cmd(["-L", "1", "/"])  
+        self.assertIn("dir1/", tree_output)
+        self.assertNotIn("file1.txt", tree_output)
+        tree_output = self.app._tree_cmd(["--max-entries", "1", "/"])  
+        self.assertEqual(len(tree_output.splitlines()), 3)
+        self.assertIn("limited to 1 entries", tree_output)
+
+    def test_tree_deep(self):
+        
+        self.app._add_to_tree(ZipInfo("deep/" + "d/" * 1500 + "leaf.txt"))  
+        tree_output = self.app._tree_cmd(["/deep"])  
+        self.assertTrue(tree_output.endswith("leaf.txt\n"))
+
     def test_echo_cmd(self):
         
         result = self.app._echo_cmd(["Hello", "World!"])  
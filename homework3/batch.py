@@ -0,0 +1,100 @@
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from config_parser import ConfigParser, translate
+from config_cache import ConfigCache, DEFAULT_MAX_SIZE
+
+
+def find_sources(source):
+    if os.path.isdir(source):
+        return sorted(str(path) for path in Path(source).iterdir() if path.is_file())
+    return sorted(glob.glob(source, recursive=True))
+
+
+def translate_file(source, output, cache_dir=None, cache_size=DEFAULT_MAX_SIZE):
+    # Выполняется в процессе-исполнителе; модули и регулярные выражения
+    # загружаются один раз на процесс, а не на файл
+    try:
+        with open(source, encoding="utf-8") as f:
+            config_text = f.read()
+        cache = ConfigCache(cache_dir, cache_size) if cache_dir else None
+        translate(ConfigParser(), config_text, [("toml", output)], cache)
+        return len(config_text.encode("utf-8")), None
+    except ValueError as e:
+        return 0, f"Syntax error: {e}"
+    except OSError as e:
+        return 0, str(e)
+
+
+def output_paths(sources, output_dir):
+    # Подкаталоги повторяются относительно общего каталога всех источников,
+    # так что одинаковые имена из разных каталогов не перезаписывают друг друга
+    parents = [os.path.dirname(os.path.abspath(source)) for source in sources]
+    root = os.path.commonpath(parents) if parents else ""
+    return [Path(output_dir, os.path.relpath(parent, root), f"{Path(source).stem}.toml")
+            for source, parent in zip(sources, parents)]
+
+
+def translate_batch(sources, output_dir, workers=None, cache_dir=None, cache_size=DEFAULT_MAX_SIZE):
+    results = {}
+    owners = {}
+    jobs_sources, outputs = [], []
+    for source, output in zip(sources, output_paths(sources, output_dir)):
+        # Совпасть могут только имена с разными расширениями в одном каталоге
+        if output in owners:
+            results[source] = 0, f"Output {output} is also produced by {owners[output]}"
+            continue
+        owners[output] = source
+        output.parent.mkdir(parents=True, exist_ok=True)
+        jobs_sources.append(source)
+        outputs.append(str(output))
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(jobs_sources) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        jobs = executor.map(translate_file, jobs_sources, outputs, [cache_dir] * len(jobs_sources),
+                            [cache_size] * len(jobs_sources), chunksize=chunksize)
+        for source, result in zip(jobs_sources, jobs):
+            results[source] = result
+    return {source: results[source] for source in sources}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Translate many config files to TOML in parallel")
+    arg_parser.add_argument("source", help="directory or glob pattern of config files")
+    arg_parser.add_argument("output_dir", help="directory for the output TOML files")
+    arg_parser.add_argument("-j", "--workers", type=int, help="number of worker processes (default: all cores)")
+    arg_parser.add_argument("--cache-dir", help="directory for cached translations")
+    arg_parser.add_argument("--cache-size", type=int, default=DEFAULT_MAX_SIZE // (1024 * 1024),
+                            help="cache size limit in MB (default: %(default)s)")
+    args = arg_parser.parse_args()
+
+    sources = find_sources(args.source)
+    if not sources:
+        print(f"No config files found: {args.source}", file=sys.stderr)
+        sys.exit(1)
+
+    start = time.perf_counter()
+    results = translate_batch(sources, args.output_dir, args.workers,
+                              args.cache_dir, args.cache_size * 1024 * 1024)
+    elapsed = time.perf_counter() - start
+
+    failed = 0
+    total_bytes = 0
+    for source, (size, error) in results.items():
+        total_bytes += size
+        if error is not None:
+            failed += 1
+            print(f"{source}: {error}", file=sys.stderr)
+
+    print(f"Translated {len(sources) - failed}/{len(sources)} files in {elapsed:.2f} s "
+          f"({len(sources) / elapsed:.1f} files/s, {total_bytes / 1024 / 1024 / elapsed:.2f} MB/s)")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import toml
+import toml_writer
+from config_parser import ConfigParser
+from config_index import ConfigIndex, write_index
+
+
+def generate_config(size):
+    parts = ["(define host [[localhost]]);\n", "(define ports ({ 80, 443, 8080 }));\n"]
+    total = sum(map(len, parts))
+    i = 0
+    while total < size:
+        block = (
+            f"service_{i} => table(\n"
+            f"    port => {8000 + i % 1000},\n"
+            f"    host => $host$,\n"
+            f"    ports => $ports$,\n"
+            f"    settings => table(\n"
+            f"        path => [[/var/log/service_{i}.log]],\n"
+            f"        tags => ({{ [[a]], [[b]], {i} }})\n"
+            f"    )\n"
+            f")\n"
+        )
+        parts.append(block)
+        total += len(block)
+        i += 1
+    return "".join(parts)
+
+
+def synthetic_config(width, depth, array_size, constants):
+    # width таблиц верхнего уровня, каждая вложена на depth уровней;
+    # в массивах по array_size элементов, часть из них — ссылки на константы
+    parts = [f"(define c{i} ({{ {', '.join(map(str, range(i, i + array_size)))} }}));\n"
+             for i in range(constants)]
+    for i in range(width):
+        for level in range(depth):
+            indent = "    " * (level % 8)
+            parts.append(f"{indent}t{i}_{level} => table(\n")
+            parts.append(f"{indent}    name => [[table {i} level {level}]],\n")
+            items = [f"$c{(i + j) % constants}$" if constants and j % 2 else str(j) for j in range(array_size)]
+            parts.append(f"{indent}    values => ({{ {', '.join(items)} }}),\n")
+        for level in reversed(range(depth)):
+            indent = "    " * (level % 8)
+            parts.append(f"{indent}    size => {level}\n{indent})\n")
+    return "".join(parts)
+
+
+# Набор замеров: имя -> параметры synthetic_config
+SUITE = {
+    "wide": dict(width=20000, depth=1, array_size=4, constants=10),
+    "deep": dict(width=20, depth=500, array_size=4, constants=10),
+    "arrays": dict(width=500, depth=2, array_size=500, constants=0),
+    "constants": dict(width=2000, depth=2, array_size=8, constants=5000),
+}
+
+
+def best_time(function, argument, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(argument)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_suite(repeat=5):
+    results = {}
+    for name, params in SUITE.items():
+        text = synthetic_config(**params)
+        parser = ConfigParser()
+        config = parser.parse(text)
+        results[name] = {
+            "parse": best_time(lambda t: ConfigParser().parse(t), text, repeat),
+            "generate_toml": best_time(parser.generate_toml, config, repeat),
+        }
+    return results
+
+
+def compare_baseline(results, baseline, threshold):
+    # Замеры, которые медленнее базовых больше чем в (1 + threshold) раз
+    regressions = []
+    for name, timings in results.items():
+        for stage, elapsed in timings.items():
+            reference = baseline.get(name, {}).get(stage)
+            if reference and elapsed > reference * (1 + threshold):
+                regressions.append((name, stage, reference, elapsed))
+    return regressions
+
+
+def check_suite(baseline_path, threshold, update):
+    results = run_suite()
+    print(f"{'case':>10} {'parse':>8} {'toml':>8}")
+    for name, timings in results.items():
+        print(f"{name:>10} {timings['parse']:>8.3f} {timings['generate_toml']:>8.3f}")
+    if update or not os.path.exists(baseline_path):
+        with open(baseline_path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {baseline_path}")
+        return True
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = compare_baseline(results, baseline, threshold)
+    for name, stage, reference, elapsed in regressions:
+        print(f"Regression: {name}/{stage} {reference:.3f}s -> {elapsed:.3f}s", file=sys.stderr)
+    return not regressions
+
+
+# Грамматика языка для фаззера: нетерминал -> варианты раскрытия
+GRAMMAR = {
+    "config": [["entry"], ["define", "entry"], ["entry", "entry"]],
+    "define": [["(define ", "name", " ", "value", ");\n"], ["(define ", "name", " ", "value", "); "]],
+    # Раскрытия без перевода строки: повторённый фрагмент остаётся одной строкой
+    "entry": [["name", " => ", "value", "\n"], ["name", " => table(\n", "entries", ")\n"],
+              ["name", " => ", "value", " "], ["name", " => table( ", "entries", ") "]],
+    "entries": [["entry"], ["entry", ",", "entries"]],
+    "value": [["number"], ["string"], ["ref"], ["({ ", "items", " })"]],
+    "items": [["value"], ["value", ", ", "items"]],
+    "number": [["1"], ["42"], ["007"]],
+    "string": [["[[text]]"], ["[[ ]]"], ["[[a]]b]]"], ["[[[[x]]"]],
+    "ref": [["$name$"], ["$c$"]],
+    "name": [["c"], ["name"], ["_x1"]],
+}
+
+# Посторонние куски, которыми портится сгенерированный текст
+NOISE = ["(", ")", "({", "})", "[[", "[[x ", "]]", "$", "=>", ",", ";", "'", "\n", " ", "define", "table(", "\\"]
+
+
+def grammar_sample(rng, symbol="config", depth=0):
+    if symbol not in GRAMMAR:
+        return symbol
+    choices = GRAMMAR[symbol]
+    # Глубже определённого уровня берётся самое короткое раскрытие
+    expansion = choices[0] if depth > 6 else rng.choice(choices)
+    return "".join(grammar_sample(rng, part, depth + 1) for part in expansion)
+
+
+def fuzz_motif(rng):
+    motif = grammar_sample(rng)
+    for _ in range(rng.randrange(3)):
+        pos = rng.randrange(len(motif) + 1)
+        motif = motif[:pos] + rng.choice(NOISE) + motif[pos:]
+    if rng.randrange(4) == 0:
+        # Все строки фрагмента остаются незакрытыми
+        motif = motif.replace("]]", "] ]")
+    return motif
+
+
+def parse_time(text):
+    start = time.perf_counter()
+    try:
+        ConfigParser().parse(text)
+    except ValueError:
+        pass
+    return time.perf_counter() - start
+
+
+FUZZ_FACTOR = 4
+
+
+def fuzz(iterations, seed=0, size=2000, factor=FUZZ_FACTOR, limit=3.0):
+    # Фрагмент повторяется size и size * factor раз; при линейном разборе время
+    # растёт примерно в factor раз, рост больше factor * limit считается находкой
+    rng = random.Random(seed)
+    findings = []
+    for _ in range(iterations):
+        motif = fuzz_motif(rng)
+        small = min(parse_time(motif * size) for _ in range(3))
+        large = min(parse_time(motif * (size * factor)) for _ in range(3))
+        ratio = large / max(small, 1e-6)
+        if ratio > factor * limit:
+            findings.append((motif, ratio))
+    return findings
+
+
+def run(size_mb):
+    text = generate_config(int(size_mb * 1024 * 1024))
+    parser = ConfigParser()
+    start = time.perf_counter()
+    parser.parse(text)
+    elapsed = time.perf_counter() - start
+    return elapsed, size_mb / elapsed
+
+
+def wide_config(width):
+    return {f"table_{i}": {"port": i, "name": f"service_{i}", "tags": ["a", "b", i]} for i in range(width)}
+
+
+def deep_config(depth, width):
+    config = table = {}
+    for level in range(depth):
+        table.update({f"key_{i}": i for i in range(width)})
+        table = table.setdefault(f"level_{level}", {})
+    return config
+
+
+def time_emitter(emit, config, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        emit(config)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_emitters():
+    configs = {
+        "wide": wide_config(20000),
+        "deep": deep_config(300, 20),
+        "parsed": ConfigParser().parse(generate_config(2 * 1024 * 1024)),
+    }
+    print(f"{'config':>8} {'toml.dumps':>12} {'toml_writer':>12} {'speedup':>8}")
+    for name, config in configs.items():
+        reference = time_emitter(toml.dumps, config)
+        native = time_emitter(lambda c: toml_writer.dump(c, io.StringIO()), config)
+        print(f"{name:>8} {reference:>12.3f} {native:>12.3f} {reference / native:>7.1f}x")
+
+
+def run_index(size_mb):
+    config = ConfigParser().parse(generate_config(int(size_mb * 1024 * 1024)))
+    key = f"service_{len(config) // 2}.settings.path"
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "config.index")
+        write_index(config, path)
+        start = time.perf_counter()
+        with ConfigIndex(path) as index:
+            value = index[key]
+        elapsed = time.perf_counter() - start
+        print(f"{size_mb:g} MB config, {os.path.getsize(path) / 1024 / 1024:.1f} MB index: "
+              f"open + lookup of {key!r} = {value!r} in {elapsed * 1e6:.0f} us")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Translator benchmarks")
+    arg_parser.add_argument("sizes", nargs="*", type=float, default=[1, 10, 100],
+                            help="input sizes in MB for the parse benchmark")
+    arg_parser.add_argument("--emit", action="store_true", help="compare the TOML emitter with toml.dumps")
+    arg_parser.add_argument("--index", action="store_true", help="time a cold key lookup in an indexed artifact")
+    arg_parser.add_argument("--suite", action="store_true",
+                            help="run the synthetic suite and compare it with the baseline")
+    arg_parser.add_argument("--baseline", default="benchmark_baseline.json",
+                            help="baseline file for --suite; written if missing")
+    arg_parser.add_argument("--threshold", type=float, default=0.25,
+                            help="allowed slowdown against the baseline, 0.25 = 25%%")
+    arg_parser.add_argument("--update-baseline", action="store_true", help="overwrite the baseline with this run")
+    arg_parser.add_argument("--fuzz", type=int, metavar="N", help="try N grammar-generated inputs for superlinear parse time")
+    arg_parser.add_argument("--seed", type=int, default=0, help="random seed for --fuzz")
+    args = arg_parser.parse_args()
+
+    if args.suite:
+        if not check_suite(args.baseline, args.threshold, args.update_baseline):
+            sys.exit(1)
+        return
+    if args.fuzz:
+        findings = fuzz(args.fuzz, args.seed)
+        for motif, ratio in findings:
+            print(f"Superlinear ({ratio:.1f}x for {FUZZ_FACTOR}x input): {motif!r}")
+        print(f"{args.fuzz} inputs, {len(findings)} superlinear")
+        if findings:
+            sys.exit(1)
+        return
+
+    if args.emit:
+        run_emitters()
+        return
+    if args.index:
+        for size_mb in args.sizes:
+            run_index(size_mb)
+        return
+
+    print(f"{'MB':>8} {'seconds':>10} {'MB/s':>8} {'s/MB':>8}")
+    for size_mb in args.sizes:
+        elapsed, throughput = run(size_mb)
+        print(f"{size_mb:>8g} {elapsed:>10.3f} {throughput:>8.2f} {elapsed / size_mb:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
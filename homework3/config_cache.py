@@ -0,0 +1,70 @@
+import hashlib
+import marshal
+import os
+from pathlib import Path
+
+# Меняется при любом изменении формата вывода, чтобы старые записи не читались
+CACHE_VERSION = b"1"
+
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+
+class ConfigCache:
+    def __init__(self, cache_dir, max_size=DEFAULT_MAX_SIZE):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+
+    def key(self, text, constants=None):
+        # Константы, заданные до разбора, тоже влияют на результат
+        digest = hashlib.sha256(CACHE_VERSION)
+        digest.update(marshal.dumps(sorted((constants or {}).items())))
+        digest.update(text.encode("utf-8"))
+        return digest.hexdigest()
+
+    def toml_path(self, key):
+        return self.cache_dir / f"{key}.toml"
+
+    def config_path(self, key):
+        return self.cache_dir / f"{key}.marshal"
+
+    def lookup(self, key):
+        path = self.toml_path(key)
+        if not (path.exists() and self.config_path(key).exists()):
+            return None
+        # Время изменения служит отметкой последнего использования для LRU
+        os.utime(path)
+        os.utime(self.config_path(key))
+        return path
+
+    def load_config(self, key):
+        with open(self.config_path(key), "rb") as f:
+            return marshal.load(f)
+
+    def store(self, key, config, toml_output):
+        self._write(self.config_path(key), marshal.dumps(config))
+        self._write(self.toml_path(key), toml_output.encode("utf-8"))
+        self.evict()
+
+    def _write(self, path, data):
+        # Запись через временный файл, чтобы параллельные запуски не видели обрывков
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def evict(self):
+        entries = []
+        total = 0
+        for path in self.cache_dir.iterdir():
+            if path.suffix not in (".toml", ".marshal"):
+                continue
+            stat = path.stat()
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
@@ -0,0 +1,127 @@
+import mmap
+import struct
+from msgpack_codec import packb, unpackb
+
+# Формат файла: заголовок, таблица записей, отсортированная по пути ключа,
+# затем пути и значения. Запись: смещение и длина пути, смещение и длина
+# значения в MessagePack; длина значения 0 обозначает таблицу.
+MAGIC = b"CFGI"
+VERSION = 1
+HEADER = struct.Struct("<4sIQ")
+ENTRY = struct.Struct("<QIQI")
+
+
+def write_index(config, path):
+    # Все значения кодируются до открытия файла: при ошибке (например, целое
+    # вне диапазона MessagePack) частичный индекс не остаётся
+    entries = []
+    stack = [("", config)]
+    while stack:
+        prefix, table = stack.pop()
+        for key, value in table.items():
+            name = prefix + key
+            if isinstance(value, dict):
+                entries.append((name.encode("utf-8"), b""))
+                stack.append((name + ".", value))
+            else:
+                entries.append((name.encode("utf-8"), packb(value)))
+    entries.sort()
+
+    offset = HEADER.size + ENTRY.size * len(entries)
+    table = bytearray()
+    for name, value in entries:
+        table += ENTRY.pack(offset, len(name), offset + len(name), len(value))
+        offset += len(name) + len(value)
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(entries)))
+        f.write(table)
+        for name, value in entries:
+            f.write(name)
+            f.write(value)
+
+
+class ConfigIndex:
+    # Файл отображается в память; при открытии читается только заголовок,
+    # ключ ищется двоичным поиском, значение декодируется при обращении
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            self.data.close()
+            raise ValueError(f"Not a config index: {path}")
+
+    def close(self):
+        self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, key):
+        return self.find(key.encode("utf-8")) is not None
+
+    def __getitem__(self, key):
+        name = key.encode("utf-8")
+        index = self.find(name)
+        if index is None:
+            raise KeyError(key)
+        _, _, value_offset, value_size = self.entry(index)
+        if value_size:
+            return unpackb(self.data[value_offset:value_offset + value_size])
+        return self.table(name + b".")
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        for index in range(self.count):
+            yield self.name(index).decode("utf-8")
+
+    def entry(self, index):
+        return ENTRY.unpack_from(self.data, HEADER.size + ENTRY.size * index)
+
+    def name(self, index):
+        name_offset, name_size, _, _ = self.entry(index)
+        return self.data[name_offset:name_offset + name_size]
+
+    def lower_bound(self, name):
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.name(mid) < name:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find(self, name):
+        index = self.lower_bound(name)
+        if index < self.count and self.name(index) == name:
+            return index
+        return None
+
+    def table(self, prefix):
+        # Поддерево собирается из записей, пути которых начинаются с prefix
+        result = {}
+        start = self.lower_bound(prefix)
+        end = self.lower_bound(prefix[:-1] + b"/")
+        for index in range(start, end):
+            name_offset, name_size, value_offset, value_size = self.entry(index)
+            parts = self.data[name_offset + len(prefix):name_offset + name_size].decode("utf-8").split(".")
+            table = result
+            for part in parts[:-1]:
+                table = table.setdefault(part, {})
+            if value_size:
+                table[parts[-1]] = unpackb(self.data[value_offset:value_offset + value_size])
+            else:
+                table.setdefault(parts[-1], {})
+        return result
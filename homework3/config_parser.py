@@ -1,84 +1,373 @@
 import sys
 import re
-import toml
+import argparse
+import shutil
+from itertools import islice
+from operator import length_hint
+import toml_writer
+from config_cache import ConfigCache, DEFAULT_MAX_SIZE
+from serializers import SERIALIZERS, parse_target, write_outputs
+
+# Все лексемы языка; ни одна из них не пересекает перевод строки,
+# поэтому текст можно разбирать кусками, выровненными по строкам.
+# Пробелы и комментарии поглощаются без возврата, так что совпадения
+# идут подряд и последним всегда стоит пустая строка конца текста.
+TOKEN_PATTERN = re.compile(
+    r"(?:\s|'[^\n]*+)*+"
+    r"(\d+|\[\[.+?\]\]|\[\[.*|\$[^$\s]+\$|=>|\(\{|\}\)|[(),;]|\w+|.|\Z)"
+)
+# Незакрытая строка [[ лексируется одной лексемой до конца строки текста: иначе
+# каждое следующее [[ той же строки заново просматривало бы её до конца
+
+EOF = ""
+
+CHUNK_SIZE = 1 << 20
+
+
+def shorten(token, limit=40):
+    # Для сообщений об ошибках: лексема незакрытой строки может быть длинной
+    return token if len(token) <= limit else token[:limit] + "..."
+
+
+class ConfigSyntaxError(ValueError):
+    def __init__(self, message, line, column):
+        super().__init__(f"{message} (line {line}, column {column})")
+        self.line = line
+        self.column = column
+
+
+class Lexer:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.chunk = ""
+        self.line = 1
+        self.chunk_tokens = []
+        self.iterator = iter(self.chunk_tokens)
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            self.line += self.chunk.count("\n")
+            self.chunk = chunk
+            self.chunk_tokens = TOKEN_PATTERN.findall(chunk)
+            while self.chunk_tokens and self.chunk_tokens[-1] == EOF:
+                self.chunk_tokens.pop()
+            self.iterator = iter(self.chunk_tokens)
+            yield from self.iterator
+        self.chunk_tokens = None
+        while True:
+            yield EOF
+
+    def position(self):
+        # Дешёвая отметка последней выданной лексемы для location()
+        if self.chunk_tokens is None:
+            return self.chunk, self.line, None
+        return self.chunk, self.line, len(self.chunk_tokens) - length_hint(self.iterator) - 1
+
+    def location(self, position=None):
+        # Позиция лексемы в строках и столбцах; вычисляется только при ошибке
+        chunk, line, index = self.position() if position is None else position
+        if index is None:
+            pos = len(chunk.rstrip())
+        else:
+            pos = next(islice(TOKEN_PATTERN.finditer(chunk), index, None)).start(1)
+        line += chunk.count("\n", 0, pos)
+        column = pos - chunk.rfind("\n", 0, pos)
+        return line, column
+
 
 class ConfigParser:
     def __init__(self):
         self.constants = {}
+        # Если задан список, в него пишутся все ссылки $имя$ как (имя, контейнер, ключ)
+        self.references = None
 
     def parse_value(self, value):
-        if re.match(r"^\d+$", value):
-            return int(value)
-        elif re.match(r"^\[\[.+\]\]$", value):
-            return value[2:-2]
-        elif re.match(r"^\(\{.+\}\)$", value):
-            array_content = value[2:-2]
-            return [self.parse_value(elem.strip()) for elem in array_content.split(",")]
-        elif re.match(r"\$.+\$", value):
-            const = value[1:-1]
-            if const in self.constants:
-                return self.constants[const]
-            raise ValueError(f"undefined constans: {const}")
-        else:
-            raise ValueError(f"Invalid value: {value}")
-    
-    def parse(self, text):
-        text = self.remove_comments(text)
-        self.parse_constants(text)
-        config = self.parse_config(text)
-        return config
-
+        self.start(Lexer([value]))
+        result = self.parse_token_value(next(self.tokens))
+        self.expect(EOF)
+        return result
 
-    def remove_comments(self, text):
-        return re.sub(r"' .*", "", text)
+    def parse(self, text):
+        return self.parse_tokens(Lexer([text]))
 
     def parse_constants(self, text):
-        define_pattern = re.compile(r"\(define\s+([_a-z]+)\s+(.+?)\);")
-        for match in define_pattern.finditer(text):
-            name, value = match.groups()
-            self.constants[name] = self.parse_value(value.strip())
+        self.parse(text)
 
     def parse_config(self, text):
+        return self.parse(text)
+
+    def start(self, lexer):
+        self.lexer = lexer
+        self.tokens = iter(lexer)
+        self.pending = []
+        self.unresolved = {}
+
+    def parse_tokens(self, lexer):
         result = {}
+        for key, value in self.iter_entries(lexer):
+            merge_entry(result, key, value)
+        return result
+
+    def iter_entries(self, lexer):
+        # Выдаёт законченные записи верхнего уровня сразу после их разбора.
+        # Записи со ссылками на ещё не объявленные константы (и все следующие
+        # за ними, чтобы сохранить порядок) придерживаются до конца текста.
+        self.start(lexer)
+        tokens = self.tokens
+        root = {}
+        # Стек вместо рекурсии: глубина вложенности table( не ограничена
         stack = []
-        for line in text.split("\n"):
-            line = line.strip()
-            if line:
-                table_name = re.match(r"(.+)\=\>\s*table\(", line)
-                if "table" in line and table_name:
-                    stack.append(table_name.group(1).strip())
-                    continue
-                res = result
-                for key in stack:
-                    res = res.setdefault(key, {})
+        current = root
+        top_key = None
+        while True:
+            token = next(tokens)
+            if token.isidentifier():
+                self.expect("=>")
+                value = next(tokens)
+                if value == "table":
+                    self.expect("(")
+                    table = current.get(token)
+                    if not isinstance(table, dict):
+                        table = current[token] = {}
+                    if not stack:
+                        top_key = token
+                    stack.append(current)
+                    current = table
+                else:
+                    current[token] = self.parse_token_value(value, current, token)
+                    if not stack and not self.pending:
+                        yield token, root.pop(token)
+            elif token == ",":
+                continue
+            elif token == ")" and stack:
+                current = stack.pop()
+                if not stack and not self.pending:
+                    yield top_key, root.pop(top_key)
+            elif token == "(":
+                self.parse_define()
+            elif token == EOF:
                 if stack:
-                    if ")" in line and re.match(r"\s*\)\s*", line):
-                        stack.pop()
-                        continue
-                    key, val = map(lambda x: x.strip(", "), line.split("=>", 1))
-                    res[key] = self.parse_value(val)
-        return result
+                    self.error("Unclosed table(")
+                break
+            else:
+                self.error(f"Unexpected {shorten(token)!r}")
+        self.resolve_pending()
+        yield from root.items()
+
+    def parse_define(self):
+        self.expect("define")
+        name = next(self.tokens)
+        if not name.isidentifier():
+            self.error(f"Invalid constant name: {shorten(name)!r}")
+        holder = {}
+        mark = len(self.pending)
+        holder[name] = self.parse_token_value(next(self.tokens), holder, name)
+        self.expect(")")
+        self.expect(";")
+        if len(self.pending) == mark:
+            self.constants[name] = holder[name]
+        else:
+            # Значение ссылается на константы, объявленные ниже по тексту
+            self.unresolved[name] = (holder, self.pending[mark:])
+            del self.pending[mark:]
+            self.constants.pop(name, None)
+        return name
+
+    def parse_token_value(self, token, container=None, key=None):
+        if token.isdecimal():
+            return int(token)
+        first = token[:1]
+        if first == "[" and len(token) > 1:
+            # У закрытой строки первое "]]" после содержимого стоит в самом конце
+            if token.find("]]", 3) != len(token) - 2:
+                self.error("Unterminated string")
+            return token[2:-2]
+        elif first == "$" and len(token) > 1:
+            const = token[1:-1]
+            if self.references is not None:
+                self.references.append((const, container, key))
+            if const in self.constants:
+                return self.constants[const]
+            if container is None:
+                self.error(f"undefined constans: {const}")
+            # Константа может быть объявлена ниже по тексту
+            self.pending.append((container, key, const, self.lexer.position()))
+            return None
+        elif token == "({":
+            array = []
+            token = next(self.tokens)
+            while token != "})":
+                array.append(self.parse_token_value(token, array, len(array)))
+                token = next(self.tokens)
+                if token == ",":
+                    token = next(self.tokens)
+                elif token != "})":
+                    self.error(f"Expected ',' or '}})', got {shorten(token)!r}")
+            return array
+        self.error(f"Invalid value: {shorten(token)}")
+
+    def resolve_pending(self):
+        self.resolve_defines()
+        self.fill_references(self.pending)
+        self.pending = []
+
+    def resolve_defines(self):
+        # Отложенные константы вычисляются в топологическом порядке, каждая
+        # один раз; значение разделяется всеми ссылками на константу
+        unresolved = self.unresolved
+        done = set()
+        for root in unresolved:
+            if root in done:
+                continue
+            path = [root]
+            refs = [iter(unresolved[root][1])]
+            while path:
+                ref = next(refs[-1], None)
+                if ref is None:
+                    name = path.pop()
+                    refs.pop()
+                    holder, references = unresolved[name]
+                    self.fill_references(references)
+                    self.constants[name] = holder[name]
+                    done.add(name)
+                    continue
+                const = ref[2]
+                if const in path:
+                    cycle = " -> ".join(path[path.index(const):] + [const])
+                    raise ConfigSyntaxError(f"Cyclic constant definition: {cycle}", *self.lexer.location(ref[3]))
+                if const in unresolved and const not in done:
+                    path.append(const)
+                    refs.append(iter(unresolved[const][1]))
+        self.unresolved = {}
+
+    def fill_references(self, references):
+        for container, key, const, position in references:
+            if const not in self.constants:
+                raise ConfigSyntaxError(f"undefined constans: {const}", *self.lexer.location(position))
+            container[key] = self.constants[const]
+
+    def expect(self, expected):
+        token = next(self.tokens)
+        if token != expected:
+            self.error(f"Expected {expected or 'end of input'!r}, got {shorten(token) or 'end of input'!r}")
+
+    def error(self, message):
+        line, column = self.lexer.location()
+        raise ConfigSyntaxError(message, line, column)
 
     def generate_toml(self, config):
-        return toml.dumps(config)
+        return toml_writer.dumps(config)
+
+    def write_toml(self, config, output):
+        toml_writer.dump(config, output)
+
+    def stream_toml(self, stream, output):
+        # Каждая таблица верхнего уровня пишется и освобождается сразу, поэтому
+        # память — одна таблица плюс имена уже записанных ключей верхнего уровня
+        # (около 100 байт на ключ). Имена нужны для точной проверки повторов:
+        # повторный ключ parse() слил бы с записанным, а второй [a] в TOML недопустим
+        emitted = set()
+        has_tables = False
+        for key, value in self.iter_entries(Lexer(read_chunks(stream))):
+            if key in emitted:
+                raise ValueError(f"Top-level key {key!r} is repeated and cannot be streamed")
+            if isinstance(value, dict):
+                if emitted:
+                    output.write("\n")
+                has_tables = True
+            elif has_tables:
+                raise ValueError(f"Top-level value {key!r} after a table cannot be streamed")
+            toml_writer.dump({key: value}, output)
+            emitted.add(key)
+
+
+def translate(parser, config_text, targets, cache=None):
+    # targets: список (формат, путь); возвращает False, если разбор не понадобился
+    toml_paths = [path for output_format, path in targets if output_format == "toml"]
+    other_targets = [(output_format, path) for output_format, path in targets if output_format != "toml"]
+    if cache is not None:
+        key = cache.key(config_text, parser.constants)
+        cached = cache.lookup(key)
+        if cached is not None:
+            for path in toml_paths:
+                shutil.copyfile(cached, path)
+            if other_targets:
+                write_outputs(cache.load_config(key), other_targets)
+            return False
+    config = parser.parse(config_text)
+    if cache is None:
+        write_outputs(config, targets)
+        return True
+    toml_output = parser.generate_toml(config)
+    for path in toml_paths:
+        with open(path, 'w') as toml_file:
+            toml_file.write(toml_output)
+    if other_targets:
+        write_outputs(config, other_targets)
+    cache.store(key, config, toml_output)
+    return True
+
+
+def merge_entry(config, key, value):
+    existing = config.get(key)
+    if isinstance(existing, dict) and isinstance(value, dict):
+        for sub_key, sub_value in value.items():
+            merge_entry(existing, sub_key, sub_value)
+    else:
+        config[key] = value
+
+
+def read_chunks(stream, size=CHUNK_SIZE):
+    # Куски выравниваются по концу строки, чтобы лексемы не разрывались
+    tail = ""
+    while True:
+        data = stream.read(size)
+        if not data:
+            break
+        data = tail + data
+        cut = data.rfind("\n") + 1
+        if cut:
+            yield data[:cut]
+        tail = data[cut:]
+    if tail:
+        yield tail
 
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python config_parser.py output.toml")
-        sys.exit(1)
+    arg_parser = argparse.ArgumentParser(description="Translate the config language from stdin to TOML")
+    arg_parser.add_argument("output", nargs="?", help="path to the output TOML file")
+    arg_parser.add_argument("--out", action="append", default=[], metavar="FORMAT=PATH",
+                            help=f"extra output in one of: {', '.join(SERIALIZERS)} (repeatable)")
+    mode = arg_parser.add_mutually_exclusive_group()
+    mode.add_argument("--stream", action="store_true",
+                      help="write each top-level table as soon as it is parsed")
+    mode.add_argument("--cache-dir", help="directory for cached translations")
+    arg_parser.add_argument("--cache-size", type=int, default=DEFAULT_MAX_SIZE // (1024 * 1024),
+                            help="cache size limit in MB (default: %(default)s)")
+    args = arg_parser.parse_args()
 
-    output_file = sys.argv[1]
-    config_text = sys.stdin.read()
+    try:
+        targets = [parse_target(target) for target in args.out]
+    except ValueError as e:
+        arg_parser.error(str(e))
+    if args.output:
+        targets.insert(0, ("toml", args.output))
+    if not targets:
+        arg_parser.error("no output given")
+    if args.stream and (len(targets) != 1 or targets[0][0] != "toml"):
+        arg_parser.error("--stream writes exactly one TOML output")
 
     parser = ConfigParser()
     try:
-        config = parser.parse(config_text)
-        toml_output = parser.generate_toml(config)
-        with open(output_file, 'w') as toml_file:
-            toml_file.write(toml_output)
-        print(f"Output written to {output_file}")
+        if args.stream:
+            with open(targets[0][1], 'w') as toml_file:
+                parser.stream_toml(sys.stdin, toml_file)
+        else:
+            cache = ConfigCache(args.cache_dir, args.cache_size * 1024 * 1024) if args.cache_dir else None
+            translate(parser, sys.stdin.read(), targets, cache)
+        for _, path in targets:
+            print(f"Output written to {path}")
     except ValueError as e:
         print(f"Syntax error: {e}", file=sys.stderr)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,410 @@
+import argparse
+import os
+import sys
+import time
+from bisect import bisect_left
+from operator import attrgetter
+import toml_writer
+from config_parser import ConfigParser, TOKEN_PATTERN, EOF, shorten
+
+# Виды единиц разбора: запись, объявление константы, заголовок и конец таблицы
+ENTRY, DEFINE, HEADER, CLOSE = range(4)
+
+BLOCK_SIZE = 1 << 16
+
+
+class StructureChanged(Exception):
+    pass
+
+
+class Unit:
+    __slots__ = ("kind", "first_line", "last_line", "container", "path", "key", "refs", "text")
+
+    def __init__(self, kind, first_line, last_line, container, path, key, refs=(), text=None):
+        self.kind = kind
+        self.first_line = first_line
+        self.last_line = last_line
+        self.container = container
+        self.path = path
+        self.key = key
+        self.refs = refs
+        self.text = text
+
+
+class IncrementalConfig:
+    def __init__(self, text):
+        self.build(text)
+
+    def build(self, text):
+        self.parser = ConfigParser()
+        # Константа -> {(id(контейнер), ключ): (контейнер, ключ, путь секции)}
+        self.refs = {}
+        # Константа -> имена констант, значения которых вычислены через неё
+        self.define_deps = {}
+        self.defines = {}
+        # Сколько раз встречается объявление константы и ключ в своей таблице:
+        # при повторах значение зависит от порядка, его учитывает только полный разбор
+        self.define_counts = {}
+        self.key_counts = {}
+        self.config = {}
+        self.units = self.scan(text, 0, self.config, ())
+        self.text = text
+        self.sections = {}
+        for path, table in iter_tables(self.config):
+            self.sections[path] = section_toml(path, table)
+
+    def toml(self):
+        return "\n".join(section for section in self.sections.values() if section)
+
+    def update(self, text):
+        # Возвращает изменившиеся секции TOML: путь таблицы -> новый текст
+        old_text = self.text
+        if text == old_text:
+            return {}
+        try:
+            changed = self.patch(text)
+        except (StructureChanged, ValueError):
+            try:
+                self.build(text)
+            except ValueError:
+                self.build(old_text)
+                raise
+            return dict(self.sections)
+        return {path: self.sections.get(path) for path in changed}
+
+    def patch(self, text):
+        old_text = self.text
+        prefix = common_prefix(old_text, text)
+        suffix = common_suffix(old_text, text, min(len(old_text), len(text)) - prefix)
+        # Изменённый участок расширяется до целых строк
+        start = old_text.rfind("\n", 0, prefix) + 1
+        old_end, new_end = len(old_text) - suffix, len(text) - suffix
+        if not (ends_line(old_text, start, old_end) and ends_line(text, start, new_end)):
+            newline = old_text.find("\n", old_end)
+            extra = (len(old_text) if newline == -1 else newline + 1) - old_end
+            old_end += extra
+            new_end += extra
+        first = old_text.count("\n", 0, start)
+        old_lines = line_count(old_text, start, old_end)
+        end = first + old_lines
+
+        units = self.units
+        i = j = bisect_left(units, first, key=attrgetter("last_line"))
+        limit = end if old_lines else first
+        while j < len(units) and units[j].first_line < limit:
+            j += 1
+        affected = units[i:j]
+        if any(unit.kind in (HEADER, CLOSE) for unit in affected):
+            raise StructureChanged
+        if len({id(unit.container) for unit in affected}) > 1:
+            raise StructureChanged
+
+        if affected:
+            container, path = affected[0].container, affected[0].path
+            fragment_first = min(first, affected[0].first_line)
+            fragment_last = max(end, affected[-1].last_line + 1)
+        else:
+            container, path = self.context(i)
+            fragment_first, fragment_last = first, end
+        fragment_start = start
+        for _ in range(first - fragment_first):
+            fragment_start = text.rfind("\n", 0, fragment_start - 1) + 1
+        fragment_end = new_end
+        for _ in range(fragment_last - end):
+            newline = text.find("\n", fragment_end)
+            fragment_end = len(text) if newline == -1 else newline + 1
+
+        constants = self.parser.constants
+        old_defines = {unit.key: constants.get(unit.key) for unit in affected if unit.kind == DEFINE}
+        if self.repeated(affected):
+            raise StructureChanged
+        for unit in affected:
+            self.unregister(unit)
+        new_units = self.scan(text[fragment_start:fragment_end], fragment_first, container, path, fragment=True)
+        # Константа, заданная через другие, может замкнуть цикл, а фрагмент разобран
+        # со старыми значениями; такие правки проверяет полный разбор
+        if any(unit.kind == DEFINE and unit.refs for unit in new_units) or self.repeated(new_units):
+            raise StructureChanged
+        new_keys = {unit.key for unit in new_units if unit.kind != DEFINE and unit.container is container}
+        new_defines = {unit.key for unit in new_units if unit.kind == DEFINE}
+        for unit in affected:
+            if unit.kind == ENTRY and unit.key not in new_keys:
+                container.pop(unit.key, None)
+            elif unit.kind == DEFINE and unit.key not in new_defines:
+                constants.pop(unit.key, None)
+                self.defines.pop(unit.key, None)
+
+        units[i:j] = new_units
+        delta = line_count(text, start, new_end) - old_lines
+        if delta:
+            for unit in units[i + len(new_units):]:
+                unit.first_line += delta
+                unit.last_line += delta
+        self.text = text
+
+        changed = {path}
+        for unit in new_units:
+            if unit.kind == HEADER:
+                changed.add(unit.path + (unit.key,))
+        self.propagate([name for name in old_defines.keys() | new_defines
+                        if constants.get(name) != old_defines.get(name)], changed)
+        for section_path in changed:
+            self.sections[section_path] = section_toml(section_path, self.table(section_path))
+        return changed
+
+    def context(self, index):
+        # Таблица, в которую попадает текст после единицы с номером index - 1
+        if index == 0:
+            return self.config, ()
+        unit = self.units[index - 1]
+        if unit.kind == HEADER:
+            return unit.container[unit.key], unit.path + (unit.key,)
+        return unit.container, unit.path
+
+    def table(self, path):
+        table = self.config
+        for key in path:
+            table = table[key]
+        return table
+
+    def propagate(self, names, changed):
+        constants = self.parser.constants
+        queue = list(names)
+        seen = set()
+        while queue:
+            name = queue.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            if self.define_counts.get(name, 0) > 1:
+                raise StructureChanged
+            if name not in constants:
+                if self.refs.get(name) or self.define_deps.get(name):
+                    raise ValueError(f"undefined constans: {name}")
+                continue
+            value = constants[name]
+            for container, key, path in self.refs.get(name, {}).values():
+                if self.key_counts.get((id(container), key), 0) > 1:
+                    raise StructureChanged
+                container[key] = value
+                changed.add(path)
+            for dependent in self.define_deps.get(name, ()):
+                self.parser.references = None
+                self.parser.parse(self.defines[dependent].text)
+                queue.append(dependent)
+
+    def repeated(self, units):
+        # Затронуты ли ключи или константы, которые встречаются в тексте не один раз,
+        # в том числе константы, на которые ссылаются единицы
+        for unit in units:
+            if unit.kind == DEFINE:
+                if self.define_counts.get(unit.key, 0) > 1:
+                    return True
+            elif unit.kind != CLOSE and self.key_counts.get((id(unit.container), unit.key), 0) > 1:
+                return True
+            if any(self.define_counts.get(const, 0) > 1 for const, _, _ in unit.refs):
+                return True
+        return False
+
+    def register(self, unit):
+        for const, container, key in unit.refs:
+            if unit.kind == DEFINE:
+                self.define_deps.setdefault(const, set()).add(unit.key)
+            else:
+                self.refs.setdefault(const, {})[(id(container), key)] = (container, key, unit.path)
+        if unit.kind == DEFINE:
+            self.defines[unit.key] = unit
+            self.define_counts[unit.key] = self.define_counts.get(unit.key, 0) + 1
+        elif unit.kind != CLOSE:
+            key = id(unit.container), unit.key
+            self.key_counts[key] = self.key_counts.get(key, 0) + 1
+
+    def unregister(self, unit):
+        for const, container, key in unit.refs:
+            if unit.kind == DEFINE:
+                self.define_deps.get(const, set()).discard(unit.key)
+            else:
+                self.refs.get(const, {}).pop((id(container), key), None)
+        if unit.kind == DEFINE:
+            self.define_counts[unit.key] -= 1
+        else:
+            self.key_counts[id(unit.container), unit.key] -= 1
+
+    def scan(self, text, first_line, container, path, fragment=False):
+        parser = self.parser
+        parser.lexer = self
+        parser.tokens = tokens = self.positioned(text, first_line)
+        parser.pending = []
+        parser.unresolved = {}
+        parser.references = references = []
+        units = []
+        stack = []
+        while True:
+            token = next(tokens)
+            unit_start = self.pos
+            unit_line = self.line_at(unit_start)
+            mark = len(references)
+            if token.isidentifier():
+                parser.expect("=>")
+                value = next(tokens)
+                if value == "table":
+                    parser.expect("(")
+                    table = container.get(token)
+                    if not isinstance(table, dict):
+                        table = container[token] = {}
+                    units.append(Unit(HEADER, unit_line, self.line_at(self.pos), container, path, token))
+                    stack.append((container, path))
+                    container, path = table, path + (token,)
+                    continue
+                container[token] = parser.parse_token_value(value, container, token)
+                unit = Unit(ENTRY, unit_line, self.line_at(self.pos), container, path, token)
+            elif token == ",":
+                continue
+            elif token == ")" and stack:
+                container, path = stack.pop()
+                units.append(Unit(CLOSE, unit_line, unit_line, container, path, None))
+                continue
+            elif token == "(":
+                name = parser.parse_define()
+                unit = Unit(DEFINE, unit_line, self.line_at(self.pos), container, path,
+                            name, text=text[unit_start:self.pos + 1])
+            elif token == EOF:
+                if stack:
+                    if fragment:
+                        raise StructureChanged
+                    parser.error("Unclosed table(")
+                break
+            elif token == ")" and fragment:
+                raise StructureChanged
+            else:
+                parser.error(f"Unexpected {shorten(token)!r}")
+            unit.refs = references[mark:]
+            units.append(unit)
+        parser.resolve_pending()
+        parser.references = None
+        for unit in units:
+            self.register(unit)
+        return units
+
+    def positioned(self, text, first_line):
+        self.scan_text = text
+        self.first_line = self.line = first_line
+        self.pos = self.line_pos = 0
+        for match in TOKEN_PATTERN.finditer(text):
+            self.pos = match.start(1)
+            yield match.group(1)
+        self.pos = len(text)
+        while True:
+            yield EOF
+
+    def line_at(self, pos):
+        self.line += self.scan_text.count("\n", self.line_pos, pos)
+        self.line_pos = pos
+        return self.line
+
+    def position(self):
+        return self.pos
+
+    def location(self, position=None):
+        text, pos = self.scan_text, self.pos if position is None else position
+        return self.first_line + text.count("\n", 0, pos) + 1, pos - text.rfind("\n", 0, pos)
+
+
+def iter_tables(config):
+    stack = [((), config)]
+    while stack:
+        path, table = stack.pop()
+        yield path, table
+        stack.extend(reversed([(path + (key,), value) for key, value in table.items()
+                               if isinstance(value, dict)]))
+
+
+def section_toml(path, table):
+    scalars = {key: value for key, value in table.items() if not isinstance(value, dict)}
+    if not path:
+        return toml_writer.dumps(scalars)
+    return f"[{'.'.join(path)}]\n" + toml_writer.dumps(scalars)
+
+
+def common_prefix(a, b):
+    size = min(len(a), len(b))
+    lo = 0
+    while lo < size and a[lo:lo + BLOCK_SIZE] == b[lo:lo + BLOCK_SIZE]:
+        lo += BLOCK_SIZE
+    if lo >= size:
+        return size
+    hi = min(lo + BLOCK_SIZE, size)
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if a[lo:mid] == b[lo:mid]:
+            lo = mid
+        else:
+            hi = mid
+    return lo if a[lo] != b[lo] else hi
+
+
+def common_suffix(a, b, limit):
+    size = 0
+    len_a, len_b = len(a), len(b)
+    while size < limit and a[len_a - min(size + BLOCK_SIZE, limit):len_a - size] == \
+            b[len_b - min(size + BLOCK_SIZE, limit):len_b - size]:
+        size = min(size + BLOCK_SIZE, limit)
+    if size >= limit:
+        return limit
+    lo, hi = size, min(size + BLOCK_SIZE, limit)
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if a[len_a - mid:len_a - size] == b[len_b - mid:len_b - size]:
+            lo = mid
+        else:
+            hi = mid
+    return lo if a[len_a - lo - 1] != b[len_b - lo - 1] else hi
+
+
+def ends_line(text, start, end):
+    return end == start or text[end - 1] == "\n"
+
+
+def line_count(text, start, end):
+    if end == start:
+        return 0
+    return text.count("\n", start, end) + (text[end - 1] != "\n")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Watch a config file and keep its TOML translation up to date")
+    arg_parser.add_argument("input", help="path to the config file to watch")
+    arg_parser.add_argument("output", help="path to the output TOML file")
+    arg_parser.add_argument("--interval", type=float, default=0.2, help="polling interval in seconds")
+    args = arg_parser.parse_args()
+
+    config = None
+    mtime = None
+    try:
+        while True:
+            current = os.stat(args.input).st_mtime_ns
+            if current != mtime:
+                mtime = current
+                with open(args.input) as f:
+                    text = f.read()
+                start = time.perf_counter()
+                try:
+                    if config is None:
+                        config = IncrementalConfig(text)
+                        changed = config.sections
+                    else:
+                        changed = config.update(text)
+                except ValueError as e:
+                    print(f"Syntax error: {e}", file=sys.stderr)
+                else:
+                    elapsed = time.perf_counter() - start
+                    with open(args.output, 'w') as toml_file:
+                        toml_file.write(config.toml())
+                    print(f"Updated {len(changed)} section(s) in {elapsed * 1000:.1f} ms")
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import struct
+
+
+def packb(value):
+    # Кодировщик MessagePack для значений языка; без рекурсии, чтобы
+    # глубокая вложенность table( не упиралась в предел стека
+    out = bytearray()
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        item_type = type(item)
+        if item_type is int:
+            out += pack_int(item)
+        elif item_type is str:
+            data = item.encode("utf-8")
+            size = len(data)
+            if size < 32:
+                out.append(0xa0 | size)
+            elif size < 0x100:
+                out += struct.pack(">BB", 0xd9, size)
+            elif size < 0x10000:
+                out += struct.pack(">BH", 0xda, size)
+            else:
+                out += struct.pack(">BI", 0xdb, size)
+            out += data
+        elif item_type is list:
+            out += pack_header(len(item), 0x90, 0xdc, 0xdd)
+            stack.extend(reversed(item))
+        elif item_type is dict:
+            out += pack_header(len(item), 0x80, 0xde, 0xdf)
+            for key, sub_value in reversed(list(item.items())):
+                stack.append(sub_value)
+                stack.append(key)
+        elif item_type is bool:
+            out.append(0xc3 if item else 0xc2)
+        elif item is None:
+            out.append(0xc0)
+        else:
+            raise TypeError(f"Unsupported msgpack value: {item!r}")
+    return bytes(out)
+
+
+def pack_header(size, fix, code16, code32):
+    if size < 16:
+        return bytes((fix | size,))
+    elif size < 0x10000:
+        return struct.pack(">BH", code16, size)
+    return struct.pack(">BI", code32, size)
+
+
+def pack_int(value):
+    # Язык допускает любые \d+, а MessagePack хранит не больше 64 бит
+    if not -0x8000000000000000 <= value < 0x10000000000000000:
+        raise ValueError(f"integer out of msgpack range: {value}")
+    if 0 <= value < 0x80:
+        return bytes((value,))
+    elif -32 <= value < 0:
+        return struct.pack(">b", value)
+    elif value >= 0:
+        if value < 0x100:
+            return struct.pack(">BB", 0xcc, value)
+        elif value < 0x10000:
+            return struct.pack(">BH", 0xcd, value)
+        elif value < 0x100000000:
+            return struct.pack(">BI", 0xce, value)
+        return struct.pack(">BQ", 0xcf, value)
+    elif value >= -0x80:
+        return struct.pack(">Bb", 0xd0, value)
+    elif value >= -0x8000:
+        return struct.pack(">Bh", 0xd1, value)
+    elif value >= -0x80000000:
+        return struct.pack(">Bi", 0xd2, value)
+    return struct.pack(">Bq", 0xd3, value)
+
+
+def unpackb(data):
+    value, _ = unpack_from(data, 0)
+    return value
+
+
+def unpack_from(data, offset):
+    code = data[offset]
+    offset += 1
+    if code < 0x80:
+        return code, offset
+    elif code >= 0xe0:
+        return code - 0x100, offset
+    elif 0xa0 <= code < 0xc0:
+        return unpack_str(data, offset, code & 0x1f)
+    elif 0x90 <= code < 0xa0:
+        return unpack_array(data, offset, code & 0x0f)
+    elif 0x80 <= code < 0x90:
+        return unpack_map(data, offset, code & 0x0f)
+    elif code == 0xc0:
+        return None, offset
+    elif code == 0xc2:
+        return False, offset
+    elif code == 0xc3:
+        return True, offset
+    elif code in INT_FORMATS:
+        fmt = INT_FORMATS[code]
+        return struct.unpack_from(fmt, data, offset)[0], offset + struct.calcsize(fmt)
+    elif code in SIZE_FORMATS:
+        kind, fmt = SIZE_FORMATS[code]
+        size = struct.unpack_from(fmt, data, offset)[0]
+        offset += struct.calcsize(fmt)
+        if kind == "str":
+            return unpack_str(data, offset, size)
+        elif kind == "array":
+            return unpack_array(data, offset, size)
+        return unpack_map(data, offset, size)
+    raise ValueError(f"Unsupported msgpack type: 0x{code:02x}")
+
+
+def unpack_str(data, offset, size):
+    return bytes(data[offset:offset + size]).decode("utf-8"), offset + size
+
+
+def unpack_array(data, offset, size):
+    result = []
+    for _ in range(size):
+        value, offset = unpack_from(data, offset)
+        result.append(value)
+    return result, offset
+
+
+def unpack_map(data, offset, size):
+    result = {}
+    for _ in range(size):
+        key, offset = unpack_from(data, offset)
+        result[key], offset = unpack_from(data, offset)
+    return result, offset
+
+
+INT_FORMATS = {
+    0xcc: ">B", 0xcd: ">H", 0xce: ">I", 0xcf: ">Q",
+    0xd0: ">b", 0xd1: ">h", 0xd2: ">i", 0xd3: ">q",
+}
+
+SIZE_FORMATS = {
+    0xd9: ("str", ">B"), 0xda: ("str", ">H"), 0xdb: ("str", ">I"),
+    0xdc: ("array", ">H"), 0xdd: ("array", ">I"),
+    0xde: ("map", ">H"), 0xdf: ("map", ">I"),
+}
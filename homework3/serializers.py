@@ -0,0 +1,64 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+import toml_writer
+from msgpack_codec import packb
+from config_index import write_index
+
+
+def write_toml(config, path):
+    with open(path, "w") as f:
+        toml_writer.dump(config, f)
+
+
+def write_json(config, path):
+    with open(path, "w") as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+
+
+def write_yaml(config, path):
+    import yaml
+
+    dumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+    # Константы-массивы разделяются между ключами; якоря в выводе не нужны
+    class Dumper(dumper):
+        def ignore_aliases(self, data):
+            return True
+
+    with open(path, "w") as f:
+        yaml.dump(config, f, Dumper=Dumper, allow_unicode=True, sort_keys=False)
+
+
+def write_msgpack(config, path):
+    with open(path, "wb") as f:
+        f.write(packb(config))
+
+
+SERIALIZERS = {
+    "toml": write_toml,
+    "json": write_json,
+    "yaml": write_yaml,
+    "msgpack": write_msgpack,
+    "index": write_index,
+}
+
+
+def parse_target(target):
+    output_format, sep, path = target.partition("=")
+    if not sep or not path:
+        raise ValueError(f"Output target must look like FORMAT=PATH: {target}")
+    if output_format not in SERIALIZERS:
+        raise ValueError(f"Unknown output format: {output_format}")
+    return output_format, path
+
+
+def write_outputs(config, targets):
+    # Дерево разбирается один раз; сериализаторы читают его из общих потоков
+    if len(targets) == 1:
+        output_format, path = targets[0]
+        SERIALIZERS[output_format](config, path)
+        return
+    with ThreadPoolExecutor(max_workers=len(targets)) as executor:
+        jobs = [executor.submit(SERIALIZERS[output_format], config, path) for output_format, path in targets]
+        for job in jobs:
+            job.result()
@@ -1,5 +1,25 @@
+import io
+import os
+import random
+import tempfile
 import unittest
-from config_parser import ConfigParser
+from pathlib import Path
+import toml
+from config_parser import ConfigParser, ConfigSyntaxError, read_chunks, translate
+from config_cache import ConfigCache
+from batch import find_sources, translate_batch
+from incremental import IncrementalConfig
+import toml_writer
+import json
+from serializers import parse_target
+from msgpack_codec import packb, unpackb
+from config_index import ConfigIndex, write_index
+from benchmark import synthetic_config, compare_baseline, fuzz, parse_time
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
 
 class TestConfigParser(unittest.TestCase):
     def setUp(self):
@@ -126,5 +146,415 @@ class TestConfigParser(unittest.TestCase):
         self.assertEqual(config['application']['version'], '2.1')
         self.assertEqual(config['application']['features'], ['feature1', 'feature2', 'feature3'])
 
+    def test_comments_and_forward_reference(self):
+        config_text = """
+        ' Комментарий
+        app => table(
+            name => $name$, ' ещё комментарий
+            ports => ({ 80, $port$ })
+        )
+        (define name [[late]]);
+        (define port 443);
+        """
+        config = self.parser.parse(config_text)
+        self.assertEqual(config['app']['name'], 'late')
+        self.assertEqual(config['app']['ports'], [80, 443])
+
+    def test_single_line_tables(self):
+        config = self.parser.parse("a => table( b => table( c => 1 ), d => ({ [[x, y]], 2 }) )")
+        self.assertEqual(config, {'a': {'b': {'c': 1}, 'd': ['x, y', 2]}})
+
+    def test_deep_nesting(self):
+        depth = 5000
+        config = self.parser.parse("k => table(\n" * depth + "v => 1\n" + ")\n" * depth)
+        for _ in range(depth):
+            config = config['k']
+        self.assertEqual(config, {'v': 1})
+
+    def test_error_location(self):
+        config_text = "app => table(\n    port => 8080,\n    name => &bad&\n)"
+        with self.assertRaises(ConfigSyntaxError) as context:
+            self.parser.parse(config_text)
+        self.assertEqual((context.exception.line, context.exception.column), (3, 13))
+
+    def test_unterminated_strings_lex_in_linear_time(self):
+        parser = ConfigParser()
+        self.assertEqual(parser.parse("a => [[[[x]]\nb => [[ ]]"), {"a": "[[x", "b": " "})
+        with self.assertRaisesRegex(ConfigSyntaxError, "Unterminated string"):
+            parser.parse("a => [[x\n]]")
+        with self.assertRaises(ConfigSyntaxError):
+            ConfigParser().parse("a => table( b => 1 ), [[x " * 1000)
+        # Сравнивается рост времени, а не секунды: при 16-кратном входе линейный
+        # разбор замедляется примерно в 16 раз, квадратичный — в 256
+        motif = "a => table( b => 1 ), [[x "
+        small = min(parse_time(motif * 1000) for _ in range(3))
+        large = min(parse_time(motif * 16000) for _ in range(3))
+        self.assertLess(large / small, 64)
+
+    def test_constant_binding_at_point_of_use(self):
+        config = ConfigParser().parse("(define a 1); t => table(x => $a$) (define a 2); u => $a$")
+        self.assertEqual(config, {"t": {"x": 1}, "u": 2})
+
+    def test_unclosed_table(self):
+        with self.assertRaises(ConfigSyntaxError):
+            self.parser.parse("app => table(\n    port => 8080\n")
+
+    def test_read_chunks_line_aligned(self):
+        chunks = list(read_chunks(io.StringIO("abc\ndefgh\nij"), size=4))
+        self.assertEqual("".join(chunks), "abc\ndefgh\nij")
+        self.assertTrue(all(chunk.endswith("\n") for chunk in chunks[:-1]))
+
+    def test_stream_toml(self):
+        config_text = """
+        (define host [[localhost]]);
+        server => table(
+            port => 8080,
+            name => $host$,
+            logs => table(
+                path => [[/var/log]]
+            )
+        ),
+        database => table(
+            name => [[db]],
+            ports => ({ 1, 2 })
+        )
+        """
+        output = io.StringIO()
+        self.parser.stream_toml(io.StringIO(config_text), output)
+        self.assertEqual(toml.loads(output.getvalue()), ConfigParser().parse(config_text))
+
+    def test_stream_toml_error_location(self):
+        config_text = "a => table(\n  x => 1\n)\nb => table(\n  y => &bad&\n)\n"
+        with self.assertRaises(ConfigSyntaxError) as context:
+            self.parser.stream_toml(io.StringIO(config_text * 3), io.StringIO())
+        self.assertEqual(context.exception.line, 5)
+
+    def test_stream_toml_rejects_unmergeable_entries(self):
+        for config_text in ("a => table(x => 1) b => table(y => 2) a => table(z => 3)",
+                            "a => table(x => 1) b => 2"):
+            with self.subTest(config_text=config_text), self.assertRaises(ValueError):
+                self.parser.stream_toml(io.StringIO(config_text), io.StringIO())
+
+    def test_cached_translation(self):
+        config_text = "server => table(\n    port => 8080\n)\n"
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = ConfigCache(Path(tmp, "cache"))
+            output = Path(tmp, "out.toml")
+            self.assertTrue(translate(ConfigParser(), config_text, [('toml', output)], cache))
+            first = output.read_text()
+            output.unlink()
+            self.assertFalse(translate(ConfigParser(), config_text, [('toml', output)], cache))
+            self.assertEqual(output.read_text(), first)
+            key = cache.key(config_text)
+            self.assertEqual(cache.load_config(key), {'server': {'port': 8080}})
+
+    def test_cache_key_depends_on_constants(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = ConfigCache(tmp)
+            self.assertNotEqual(cache.key("a => $x$", {'x': 1}), cache.key("a => $x$", {'x': 2}))
+
+    def test_cache_lru_eviction(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = ConfigCache(tmp, max_size=120)
+            cache.store("old", {'a': 1}, "a = 1\n")
+            cache.store("used", {'b': 2}, "b = 2\n")
+            os.utime(cache.toml_path("old"), (0, 0))
+            os.utime(cache.config_path("old"), (0, 0))
+            cache.store("new", {'c': "x" * 80}, "c = 3\n")
+            self.assertIsNone(cache.lookup("old"))
+            self.assertIsNotNone(cache.lookup("used"))
+            self.assertIsNotNone(cache.lookup("new"))
+
+    def test_translate_batch(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source_dir = Path(tmp, "src")
+            source_dir.mkdir()
+            Path(source_dir, "web.conf").write_text("web => table(\n    port => 80\n)\n")
+            Path(source_dir, "db.conf").write_text("db => table(\n    name => [[main]]\n)\n")
+            Path(source_dir, "bad.conf").write_text("bad => table(\n    key => &x&\n)\n")
+            sources = find_sources(str(source_dir))
+            results = translate_batch(sources, Path(tmp, "out"), workers=2)
+            errors = {Path(source).name: error for source, (_, error) in results.items()}
+            self.assertIsNone(errors["web.conf"])
+            self.assertIsNone(errors["db.conf"])
+            self.assertIn("line 2", errors["bad.conf"])
+            self.assertEqual(toml.loads(Path(tmp, "out", "web.toml").read_text()), {'web': {'port': 80}})
+
+    def test_translate_batch_same_stem(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in ("prod/app.conf", "dev/app.conf", "dev/app.txt"):
+                Path(tmp, "src", name).parent.mkdir(parents=True, exist_ok=True)
+                Path(tmp, "src", name).write_text(f"name => [[{name}]]\n")
+            sources = find_sources(str(Path(tmp, "src", "**", "*.*")))
+            results = translate_batch(sources, Path(tmp, "out"), workers=2)
+            errors = {Path(source).relative_to(Path(tmp, "src")).as_posix(): error
+                      for source, (_, error) in results.items()}
+            self.assertIsNone(errors["prod/app.conf"])
+            self.assertIsNone(errors["dev/app.conf"])
+            self.assertIn("dev/app.conf", errors["dev/app.txt"])
+            for name in ("prod", "dev"):
+                config = toml.loads(Path(tmp, "out", name, "app.toml").read_text())
+                self.assertEqual(config, {'name': f"{name}/app.conf"})
+
+    def test_incremental_value_edit(self):
+        config_text = """(define host [[localhost]]);
+        server => table(
+            port => 8080,
+            name => $host$
+        )
+        database => table(
+            name => [[db]]
+        )
+        """
+        config = IncrementalConfig(config_text)
+        edited = config_text.replace("8080", "9090")
+        changed = config.update(edited)
+        self.assertEqual(list(changed), [('server',)])
+        self.assertEqual(config.config, ConfigParser().parse(edited))
+        self.assertEqual(toml.loads(config.toml()), config.config)
+
+    def test_incremental_define_edit(self):
+        config_text = """(define port 443);
+        (define ports ({ 80, $port$ }));
+        server => table(
+            ports => $ports$
+        )
+        database => table(
+            name => [[db]]
+        )
+        """
+        config = IncrementalConfig(config_text)
+        changed = config.update(config_text.replace("443", "8443"))
+        self.assertIn(('server',), changed)
+        self.assertNotIn(('database',), changed)
+        self.assertEqual(config.config['server']['ports'], [80, 8443])
+
+    def test_incremental_structure_edit(self):
+        config_text = "server => table(\n    port => 8080\n)\n"
+        config = IncrementalConfig(config_text)
+        edited = "server => table(\n    logs => table(\n        level => 1\n    )\n)\n"
+        config.update(edited)
+        self.assertEqual(config.config, ConfigParser().parse(edited))
+        with self.assertRaises(ConfigSyntaxError):
+            config.update("server => table(\n")
+        self.assertEqual(config.config, ConfigParser().parse(edited))
+
+    def test_incremental_matches_fresh_parse(self):
+        config = IncrementalConfig("(define a 1);\n(define b 2);\nsrv => table( x => $a$ )\n")
+        for edited in ["(define a $a$);\n(define b 2);\nsrv => table( x => $a$ )\n",
+                       "(define a 1);\n(define b $a$);\nsrv => table( x => $b$ )\n",
+                       "(define a 5);\n(define b $a$);\nsrv => table( x => $b$ )\n",
+                       "(define a $b$);\n(define b $a$);\nsrv => table( x => $b$ )\n"]:
+            try:
+                expected = ConfigParser().parse(edited)
+            except ValueError:
+                with self.assertRaises(ValueError):
+                    config.update(edited)
+            else:
+                config.update(edited)
+                self.assertEqual(config.config, expected)
+
+    def test_incremental_redefinitions_and_duplicate_keys(self):
+        config_text = "(define a 1);\nt => table( x => $a$ )\n(define a 2);\nu => table( y => $a$ )\n"
+        edits = [config_text.replace("a 2", "a 3"),
+                 config_text.replace("t => table( x", "t => table( x => 5,\nx"),
+                 config_text.replace("t => table(", "t => table(\ny => 4,\ny => 6,")]
+        for edited in edits:
+            with self.subTest(edited=edited):
+                config = IncrementalConfig(config_text)
+                config.update(edited)
+                self.assertEqual(config.config, ConfigParser().parse(edited))
+
+    def test_incremental_random_edits(self):
+        # Случайные вставки, удаления и замены строк сверяются с полным разбором
+        pool = ["(define a 1);", "(define a 2);", "(define b 3);", "(define b $a$);", "x => $a$", "y => $b$",
+                "x => 7", "y => [[s]]", "t => table(", ")", "u => table( x => $a$ )", "x => ({ $a$, 2 })"]
+        rng = random.Random(7)
+        for _ in range(100):
+            lines = ["(define a 1);", "t => table(", "x => $a$", ")", "(define a 2);", "u => table( y => $a$ )"]
+            config = IncrementalConfig("\n".join(lines) + "\n")
+            for _ in range(20):
+                edited = list(lines)
+                pos = rng.randrange(len(edited) + 1)
+                operation = rng.randrange(3) if edited else 0
+                if operation == 0:
+                    edited.insert(pos, rng.choice(pool))
+                elif operation == 1:
+                    del edited[min(pos, len(edited) - 1)]
+                else:
+                    edited[min(pos, len(edited) - 1)] = rng.choice(pool)
+                text = "\n".join(edited) + "\n"
+                try:
+                    expected = ConfigParser().parse(text)
+                except ValueError:
+                    with self.assertRaises(ValueError):
+                        config.update(text)
+                    continue
+                config.update(text)
+                self.assertEqual(config.config, expected, text)
+                lines = edited
+
+    def test_generate_toml_matches_output_file(self):
+        config = {
+            "queue": {
+                "myserver": "myserver",
+                "port": 8080,
+                "host": "localhost",
+                "arr": ["some_value", 12],
+                "settings": {
+                    "logpath": "/var/log/server.log",
+                    "mode": "debug",
+                    "lol": {"logpath": "/var/log/server.log", "mode": "debug"},
+                },
+            }
+        }
+        expected = Path(__file__).with_name("output.toml").read_text()
+        self.assertEqual(self.parser.generate_toml(config), expected)
+
+    def test_toml_writer_matches_toml_dumps(self):
+        config = {
+            "top": 1,
+            "names": ["a", 'quote " and \\ slash', "tab\t", []],
+            "a": {"x": 1, "b": {"c": {"d": [1, 2]}}, "e": {}},
+            "f": {"g h": {"i": "j"}},
+        }
+        self.assertEqual(toml_writer.dumps(config), toml.dumps(config))
+
+    def test_write_toml_to_file(self):
+        config = {"server": {"port": 8080, "host": "localhost"}}
+        output = io.StringIO()
+        self.parser.write_toml(config, output)
+        self.assertEqual(output.getvalue(), self.parser.generate_toml(config))
+
+    def test_multiple_outputs(self):
+        config_text = """
+        (define ports ({ 80, 443 }));
+        web => table(
+            ports => $ports$,
+            backup => $ports$,
+            name => [[web]]
+        )
+        """
+        expected = ConfigParser().parse(config_text)
+        with tempfile.TemporaryDirectory() as tmp:
+            formats = ("toml", "json", "msgpack") + (("yaml",) if yaml else ())
+            targets = [(output_format, Path(tmp, f"out.{output_format}")) for output_format in formats]
+            translate(ConfigParser(), config_text, targets)
+            self.assertEqual(toml.loads(Path(tmp, "out.toml").read_text()), expected)
+            self.assertEqual(json.loads(Path(tmp, "out.json").read_text()), expected)
+            self.assertEqual(Path(tmp, "out.msgpack").read_bytes(), packb(expected))
+            if yaml:
+                yaml_text = Path(tmp, "out.yaml").read_text()
+                self.assertNotIn("&", yaml_text)
+                self.assertEqual(yaml.safe_load(yaml_text), expected)
+
+    def test_packb(self):
+        self.assertEqual(packb({"a": [1, 300, "x"]}), b"\x81\xa1a\x93\x01\xcd\x01\x2c\xa1x")
+        self.assertEqual(packb(70000), b"\xce\x00\x01\x11\x70")
+        self.assertEqual(packb("s" * 40)[:2], b"\xd9\x28")
+        self.assertEqual(packb(list(range(20)))[:3], b"\xdc\x00\x14")
+        self.assertEqual(packb(2 ** 64 - 1), b"\xcf" + b"\xff" * 8)
+        for value in (2 ** 64, -2 ** 63 - 1):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                packb({"x": [value]})
+
+    def test_parse_target(self):
+        self.assertEqual(parse_target("json=out.json"), ("json", "out.json"))
+        with self.assertRaises(ValueError):
+            parse_target("xml=out.xml")
+        with self.assertRaises(ValueError):
+            parse_target("out.json")
+
+    def test_unpackb(self):
+        value = {"a": [1, 300, -5, 70000, "x" * 40], "b": {"c": "é"}, "d": []}
+        self.assertEqual(unpackb(packb(value)), value)
+
+    def test_config_index(self):
+        config = ConfigParser().parse("""
+        server => table(
+            port => 8080,
+            hosts => ({ [[a]], [[b]] }),
+            logs => table(
+                level => 3
+            ),
+            empty => table(
+            )
+        )
+        server_extra => table(
+            port => 1
+        )
+        """)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp, "config.index")
+            write_index(config, path)
+            with ConfigIndex(path) as index:
+                self.assertEqual(index["server.port"], 8080)
+                self.assertEqual(index["server.hosts"], ["a", "b"])
+                self.assertEqual(index["server.logs.level"], 3)
+                self.assertEqual(index["server"], config["server"])
+                self.assertEqual(index["server.empty"], {})
+                self.assertNotIn("server.missing", index)
+                self.assertIsNone(index.get("missing"))
+                with self.assertRaises(KeyError):
+                    index["server.port.x"]
+
+    def test_config_index_large_integer(self):
+        config = ConfigParser().parse("a => table( x => 123456789012345678901234 )")
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp, "config.index")
+            with self.assertRaises(ValueError):
+                write_index(config, path)
+            self.assertFalse(path.exists())
+
+    def test_forward_constant_definitions(self):
+        config = ConfigParser().parse("""
+        (define ports ({ $http$, $https$ }));
+        (define http $base$);
+        (define https 443);
+        (define base 80);
+        server => table(
+            ports => $ports$,
+            backup => $ports$
+        )
+        """)
+        self.assertEqual(config["server"]["ports"], [80, 443])
+        self.assertIs(config["server"]["ports"], config["server"]["backup"])
+
+    def test_long_forward_constant_chain(self):
+        size = 5000
+        defines = "".join(f"(define c{i} $c{i + 1}$);\n" for i in range(size))
+        config = ConfigParser().parse(defines + f"(define c{size} 7);\nvalue => $c0$")
+        self.assertEqual(config["value"], 7)
+
+    def test_cyclic_constant_definition(self):
+        with self.assertRaises(ConfigSyntaxError) as error:
+            ConfigParser().parse("(define a ({ 1, $b$ }));\n(define b $c$);\n(define c $a$);")
+        self.assertIn("Cyclic constant definition: a -> b -> c -> a", str(error.exception))
+        self.assertEqual(error.exception.line, 3)
+        with self.assertRaisesRegex(ConfigSyntaxError, "a -> a"):
+            ConfigParser().parse("(define a ({ $a$ }));")
+
+    def test_undefined_constant_in_definition(self):
+        with self.assertRaisesRegex(ConfigSyntaxError, r"undefined constans: missing \(line 2, column 19\)"):
+            ConfigParser().parse("(define a 1);\n(define b ({ $a$, $missing$ }));")
+
+    def test_synthetic_config(self):
+        config = ConfigParser().parse(synthetic_config(width=3, depth=4, array_size=5, constants=2))
+        self.assertEqual(len(config), 3)
+        table = config["t2_0"]["t2_1"]["t2_2"]["t2_3"]
+        self.assertEqual(table["name"], "table 2 level 3")
+        self.assertEqual(table["values"], [0, [1, 2, 3, 4, 5], 2, [1, 2, 3, 4, 5], 4])
+        self.assertEqual(table["size"], 3)
+
+    def test_compare_baseline(self):
+        baseline = {"wide": {"parse": 1.0, "generate_toml": 1.0}}
+        results = {"wide": {"parse": 1.2, "generate_toml": 1.5}, "new": {"parse": 9.0}}
+        self.assertEqual(compare_baseline(results, baseline, 0.25), [("wide", "generate_toml", 1.0, 1.5)])
+
+    def test_fuzz_finds_no_superlinear_inputs(self):
+        # Входы различаются в 16 раз: линейный разбор даёт отношение около 16,
+        # квадратичный — сотни, так что порог 64 не зависит от скорости машины
+        self.assertEqual(fuzz(5, seed=1, size=500, factor=16, limit=4), [])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,105 @@
+import io
+import re
+
+# Вывод совпадает побайтно с toml.dumps для значений, которые порождает язык:
+# целые числа, строки, массивы и вложенные словари.
+BARE_KEY = re.compile(r"[A-Za-z0-9_-]+")
+
+BUFFER_SIZE = 1 << 16
+
+
+class BufferedWriter:
+    def __init__(self, output, buffer_size=BUFFER_SIZE):
+        self.output = output
+        self.buffer_size = buffer_size
+        self.parts = []
+        self.size = 0
+        self.written = False
+
+    def write(self, text):
+        self.parts.append(text)
+        self.size += len(text)
+        self.written = True
+        if self.size >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        self.output.write("".join(self.parts))
+        self.parts = []
+        self.size = 0
+
+
+def dumps(config):
+    output = io.StringIO()
+    dump(config, output)
+    return output.getvalue()
+
+
+def dump(config, output):
+    writer = BufferedWriter(output)
+    write_config(config, writer)
+    writer.flush()
+
+
+def write_config(config, writer):
+    # Секции выводятся по уровням вложенности, как это делает toml.dumps
+    parts = []
+    level = table_parts(config, "", parts)
+    if parts:
+        writer.write("".join(parts))
+    while level:
+        next_level = []
+        for name, table in level:
+            parts = []
+            subsections = table_parts(table, name + ".", parts)
+            if parts or not subsections:
+                separator = "\n" if writer.written else ""
+                writer.write(f"{separator}[{name}]\n" + "".join(parts))
+            next_level.extend(subsections)
+        level = next_level
+
+
+def table_parts(table, prefix, parts):
+    subsections = []
+    for key, value in table.items():
+        if not BARE_KEY.fullmatch(key):
+            key = dump_str(key)
+        if type(value) is dict:
+            subsections.append((prefix + key, value))
+        elif value is not None:
+            parts.append(f"{key} = {dump_value(value)}\n")
+    return subsections
+
+
+def dump_value(value):
+    value_type = type(value)
+    if value_type is int:
+        return str(value)
+    elif value_type is str:
+        return dump_str(value)
+    elif value_type is list:
+        return "[" + "".join([f" {dump_value(item)}," for item in value]) + "]"
+    elif value_type is bool:
+        return "true" if value else "false"
+    raise TypeError(f"Unsupported TOML value: {value!r}")
+
+
+def dump_str(value):
+    text = repr(value)
+    if text[1:-1] == value and '"' not in value:
+        return f'"{value}"'
+    return '"' + "".join([escape_char(char) for char in value]) + '"'
+
+
+def escape_char(char):
+    # Те же escape-последовательности, что получаются у toml.dumps из repr()
+    if char == '"' or char == "\\":
+        return "\\" + char
+    elif char in "\t\n\r":
+        return repr(char)[1:-1]
+    elif char.isprintable():
+        return char
+    code = ord(char)
+    if code < 0x10000:
+        return f"\\u{code:04x}"
+    return f"\\U{code:08x}"
@@ -1,5 +1,8 @@
-import yaml
-import sys
+import argparse
+import os
+import threading
+from queue import Queue
+from sinks import FORMATS, open_sink, sink_format
 
 # Определяем опкоды для команд
 COMMANDS = {
@@ -9,17 +12,35 @@ COMMANDS = {
     "BITREV": 87,
 }
 
+# Размер буфера двоичного вывода и порции записей лога
+FLUSH_SIZE = 1 << 16
+LOG_BATCH = 1000
+
+LOG_FIELDS = ("Command", "Operand_B", "Operand_C")
+# Сколько порций лога может ждать записи
+LOG_QUEUE_SIZE = 16
+
 class TempBuffer:
     def __init__(self) -> None:
         self.binary_data = bytearray()
         self.bit_size = 0
     
     def write(self, x, bit_width):
-        for i in range(bit_width):
-            if (self.bit_size + 1) > len(self.binary_data) * 8:
-                self.binary_data.append(0)
-            self.binary_data[self.bit_size // 8] ^= (((x >> i) & 1) << (self.bit_size % 8))
-            self.bit_size += 1
+        # Поле дописывается целиком: младшие биты идут первыми (little-endian),
+        # недописанный последний байт объединяется с новым значением
+        x &= (1 << bit_width) - 1
+        offset = self.bit_size % 8
+        if offset:
+            x = (x << offset) | self.binary_data.pop()
+        self.binary_data += x.to_bytes((offset + bit_width + 7) // 8, "little")
+        self.bit_size += bit_width
+
+    def flush(self, output):
+        # Записывает готовые байты в output; недописанный байт остаётся в буфере
+        size = self.bit_size // 8
+        output.write(self.binary_data[:size])
+        del self.binary_data[:size]
+        self.bit_size -= size * 8
 
     def align_to_bytes(self):
         while self.bit_size % 8 != 0:
@@ -37,59 +58,124 @@ def parse_line(line):
     operand_c = int(parts[2])
     return command, operand_b, operand_c
 
+def encode_instruction(opcode, operand_b, operand_c):
+    # 7 бит опкода, 22 бита operand_b, 18 бит operand_c, 17 бит выравнивания
+    return (opcode & 0x7F) | ((operand_b & 0x3FFFFF) << 7) | ((operand_c & 0x3FFFF) << 29)
+
 def process_command(command, operand_b, operand_c, buffer):
     opcode = COMMANDS.get(command)
     if opcode is None:
         raise ValueError(f"Unknown command: {command}")
     
-    # Записываем данные в соответствии с форматом
-    buffer.write(opcode, 7)      # 7-битный опкод
-    buffer.write(operand_b, 22) # 22 бита для operand_b
-    buffer.write(operand_c, 18) # 18 бит для operand_c
-    buffer.write(0, 17)         # 17 бит для выравнивания
+    # Команда записывается одним 64-битным словом
+    buffer.write(encode_instruction(opcode, operand_b, operand_c), 64)
 
-def assemble(input_path, binary_path, log_path):
-    buffer = TempBuffer()
+class LogWriter:
+    # Лог пишется в фоновом потоке; очередь ограничена, поэтому память
+    # не растёт, даже если запись отстаёт от разбора
+    def __init__(self, log_path, output_format=None):
+        self.sink = open_sink(log_path, LOG_FIELDS, output_format)
+        self.numeric = self.sink.numeric
+        self.queue = Queue(maxsize=LOG_QUEUE_SIZE)
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
 
-    # Считываем и обрабатываем строки из входного файла
-    with open(input_path, "r") as f:
-        lines = f.readlines()
+    def run(self):
+        with self.sink:
+            while True:
+                rows = self.queue.get()
+                if rows is None:
+                    break
+                # После ошибки очередь только вычитывается, чтобы не блокировать разбор
+                if self.error is None:
+                    try:
+                        self.sink.write(rows)
+                    except Exception as e:
+                        self.error = e
 
-    for line in lines:
-        parsed = parse_line(line)
-        if parsed is not None:
-            command, operand_b, operand_c = parsed
-            process_command(command, operand_b, operand_c, buffer)
+    def write(self, rows):
+        self.queue.put(rows)
 
-    # Выравниваем данные до целых байтов
-    buffer.align_to_bytes()
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
 
-    # Сохраняем бинарные данные
-    with open(binary_path, "wb") as f:
-        f.write(buffer.binary_data)
+def assemble(input_path, binary_path, log_path=None, log_format=None):
+    # Один проход: каждая строка разбирается один раз, команда сразу пишется
+    # в двоичный файл и в порцию лога; без log_path лог не ведётся.
+    # Оба файла пишутся во временные рядом и заменяются только после
+    # успешного разбора, так что при ошибке прежние файлы остаются целыми
+    buffer = TempBuffer()
+    tmp_path = f"{binary_path}.{os.getpid()}.tmp"
+    tmp_log_path = None if log_path is None else f"{log_path}.{os.getpid()}.tmp"
+    rows = []
+
+    try:
+        # Формат лога берётся по имени настоящего файла, а не временного
+        log = None if log_path is None else LogWriter(tmp_log_path, sink_format(log_path, log_format))
+        try:
+            with open(input_path, "r") as f, open(tmp_path, "wb") as output:
+                for line in f:
+                    parsed = parse_line(line)
+                    if parsed is not None:
+                        command, operand_b, operand_c = parsed
+                        process_command(command, operand_b, operand_c, buffer)
+                        if len(buffer.binary_data) >= FLUSH_SIZE:
+                            buffer.flush(output)
+                        if log is not None:
+                            rows.append((COMMANDS[command] if log.numeric else command, operand_b, operand_c))
+                            if len(rows) >= LOG_BATCH:
+                                log.write(rows)
+                                rows = []
 
-    # Логируем команды в YAML
-    log_assembly(input_path, log_path)
+                # Выравниваем данные до целых байтов
+                buffer.align_to_bytes()
+                buffer.flush(output)
+            if log is not None:
+                log.write(rows)
+        finally:
+            if log is not None:
+                log.close()
+        os.replace(tmp_path, binary_path)
+        if log_path is not None:
+            os.replace(tmp_log_path, log_path)
+    finally:
+        for path in (tmp_path, tmp_log_path):
+            if path is not None and os.path.exists(path):
+                os.remove(path)
 
-def log_assembly(input_file, log_file):
-    log_data = []
-    with open(input_file, 'r') as infile:
+def log_assembly(input_file, log_file, output_format=None):
+    # Лог пишется порциями; в двоичных форматах команда хранится опкодом
+    rows = []
+    with open(input_file, 'r') as infile, open_sink(log_file, LOG_FIELDS, output_format) as sink:
         for line in infile:
             parsed = parse_line(line)
             if parsed is not None:
                 command, operand_b, operand_c = parsed
-                log_data.append({"Command": command, "Operand_B": operand_b, "Operand_C": operand_c})
-    
-    # Сохраняем лог в формате YAML
-    with open(log_file, 'w') as yamlfile:
-        yaml.dump(log_data, yamlfile, default_flow_style=False)
+                if sink.numeric:
+                    opcode = COMMANDS.get(command)
+                    if opcode is None:
+                        raise ValueError(f"Unknown command: {command}")
+                    rows.append((opcode, operand_b, operand_c))
+                else:
+                    rows.append((command, operand_b, operand_c))
+                if len(rows) >= LOG_BATCH:
+                    sink.write(rows)
+                    rows = []
+        sink.write(rows)
 
 if __name__ == "__main__":
-    if len(sys.argv) < 4:
-        print("Usage: python assemble.py <input_file> <binary_file> <log_file>")
-        sys.exit(1)
-    
-    input_file = sys.argv[1]
-    binary_file = sys.argv[2]
-    log_file = sys.argv[3]
-    assemble(input_file, binary_file, log_file)
+    arg_parser = argparse.ArgumentParser(description="Assembler for the educational VM")
+    arg_parser.add_argument("input_file")
+    arg_parser.add_argument("binary_file")
+    arg_parser.add_argument("log_file", nargs="?")
+    arg_parser.add_argument("--log-format", choices=FORMATS,
+                            help="log format; by default taken from the file extension, yaml otherwise")
+    arg_parser.add_argument("--no-log", action="store_true", help="do not write the assembly log")
+    args = arg_parser.parse_args()
+    if args.log_file is None and not args.no_log:
+        arg_parser.error("log_file is required unless --no-log is given")
+    assemble(args.input_file, args.binary_file, None if args.no_log else args.log_file, args.log_format)
@@ -0,0 +1,109 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from assembler import assemble
+from interpreter import MAX_BITREV_WIDTH, MEMORY_MODELS, make_memory, memory_values, run_file
+from sinks import FORMATS, NUMERIC_FORMATS, open_sink, sink_format
+
+BATCH_FIELDS = ("Program", "Address", "Value")
+
+
+def find_programs(directory):
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".txt"))
+
+
+def run_program(path, work_dir, memory_range, model="dense", size=None, jit=False, width=0, jit_cache=None):
+    # Выполняется в рабочем процессе; модули загружаются один раз на процесс,
+    # а двоичный файл перезаписывается в файле с номером процесса
+    name = os.path.splitext(os.path.basename(path))[0]
+    binary_path = os.path.join(work_dir, f"{os.getpid()}.bin")
+    try:
+        start = time.perf_counter()
+        assemble(path, binary_path)
+        assembled = time.perf_counter()
+        memory = make_memory(model, size)
+        run_file(binary_path, memory, jit=jit, width=width, jit_cache=jit_cache)
+        values = memory_values(memory, *memory_range)
+        finished = time.perf_counter()
+    except (ValueError, IndexError, OSError) as e:
+        return name, None, str(e), 0.0, 0.0
+    return name, values, None, assembled - start, finished - assembled
+
+
+def run_batch(paths, output_path, memory_range, workers=None, output_format=None, report=None, **options):
+    # Результаты пишутся по мере готовности в порядке файлов. В bin/npy каждая
+    # программа — строка значений диапазона, в yaml/csv — строки программа/адрес/значение
+    start, end = memory_range
+    output_format = sink_format(output_path, output_format)
+    numeric = output_format in NUMERIC_FORMATS
+    fields = tuple(range(start, end)) if numeric else BATCH_FIELDS
+    workers = workers or os.cpu_count() or 1
+    failed = []
+    with tempfile.TemporaryDirectory() as work_dir, \
+            ProcessPoolExecutor(max_workers=workers) as executor, \
+            open_sink(output_path, fields, output_format) as sink:
+        # Мелкие программы раздаются пачками, чтобы не платить за пересылку каждой
+        jobs = executor.map(partial(run_program, work_dir=work_dir, memory_range=memory_range, **options), paths,
+                            chunksize=max(1, len(paths) // (workers * 8)))
+        for name, values, error, assemble_time, execute_time in jobs:
+            if error is not None:
+                failed.append(name)
+                print(f"{name}: error: {error}", file=sys.stderr)
+                continue
+            if numeric:
+                sink.write_values(values)
+            else:
+                sink.write([(name, address, value) for address, value in enumerate(values, start)])
+            if report is not None:
+                print(f"{name}: assemble {assemble_time * 1000:.2f} ms, execute {execute_time * 1000:.2f} ms",
+                      file=report)
+    return failed
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Assemble and run every .txt program in a directory")
+    arg_parser.add_argument("programs_dir")
+    arg_parser.add_argument("resultult_file")
+    arg_parser.add_argument("memory_start", type=int)
+    arg_parser.add_argument("memory_end", type=int)
+    arg_parser.add_argument("--workers", type=int, help="number of worker processes (default: all cores)")
+    arg_parser.add_argument("--format", choices=FORMATS,
+                            help="result format; by default taken from the file extension, yaml otherwise")
+    arg_parser.add_argument("--memory", choices=MEMORY_MODELS, default="dense",
+                            help="dense array or sparse pages covering the full address space")
+    arg_parser.add_argument("--memory-size", type=int, help="number of memory words")
+    arg_parser.add_argument("--bitrev-width", type=int, default=0,
+                            help=f"reverse the low N bits (1-{MAX_BITREV_WIDTH}); 0 reverses the significant bits")
+    arg_parser.add_argument("--jit", action="store_true",
+                            help="compile programs into Python functions before running them")
+    arg_parser.add_argument("--jit-cache", metavar="DIR",
+                            help="keep compiled code in DIR so that later --jit runs skip compilation")
+    arg_parser.add_argument("--quiet", action="store_true", help="do not print per-program timings")
+    args = arg_parser.parse_args()
+    if not 0 <= args.bitrev_width <= MAX_BITREV_WIDTH:
+        arg_parser.error(f"--bitrev-width must be between 0 and {MAX_BITREV_WIDTH}")
+    if args.jit_cache and not args.jit:
+        arg_parser.error("--jit-cache requires --jit")
+    size = len(make_memory(args.memory, args.memory_size))
+    if not 0 <= args.memory_start < args.memory_end <= size:
+        arg_parser.error("Invalid memory range.")
+
+    paths = find_programs(args.programs_dir)
+    workers = args.workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    failed = run_batch(paths, args.resultult_file, (args.memory_start, args.memory_end), workers, args.format,
+                       None if args.quiet else sys.stdout, model=args.memory, size=args.memory_size, jit=args.jit,
+                       width=args.bitrev_width, jit_cache=args.jit_cache)
+    elapsed = time.perf_counter() - start
+    print(f"{len(paths)} programs on {workers} workers in {elapsed:.3f}s "
+          f"({len(paths) / elapsed:,.0f} programs/s), {len(failed)} failed")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
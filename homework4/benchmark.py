@@ -0,0 +1,269 @@
+import argparse
+from array import array
+import contextlib
+import os
+import random
+import tempfile
+import time
+import yaml
+from assembler import TempBuffer, COMMANDS, assemble, log_assembly, process_command
+from interpreter import MEMORY_SIZE, make_handlers, write_result, Tracer, decode, execute, make_memory, run
+import jit
+
+
+class BitLoopBuffer(TempBuffer):
+    # Прежняя побитовая запись, оставлена для сравнения
+    def write(self, x, bit_width):
+        for i in range(bit_width):
+            if (self.bit_size + 1) > len(self.binary_data) * 8:
+                self.binary_data.append(0)
+            self.binary_data[self.bit_size // 8] ^= (((x >> i) & 1) << (self.bit_size % 8))
+            self.bit_size += 1
+
+    def align_to_bytes(self):
+        while self.bit_size % 8 != 0:
+            self.write(0, 1)
+
+
+def bit_loop_execute(binary_data, memory):
+    # Прежний цикл интерпретатора: побитовое чтение полей и цепочка if/elif
+    bit_it = 0
+
+    def read_bits(bit_width):
+        nonlocal bit_it
+        result = 0
+        for i in range(bit_width):
+            result ^= (((binary_data[bit_it // 8] >> (bit_it % 8)) & 1) << i)
+            bit_it += 1
+        return result
+
+    while bit_it < len(binary_data) * 8:
+        opcode = read_bits(7)
+        operand_b = read_bits(22)
+        operand_c = read_bits(18)
+        if read_bits(17) != 0:
+            raise ValueError("Unexpected padding bits.")
+        if opcode == 86:
+            memory[operand_b] = operand_c
+            print(f"LOAD: Mem[{operand_b}] = {operand_c}")
+        elif opcode == 58:
+            memory[operand_b] = memory[operand_c]
+            print(f"READ: Mem[{operand_b}] = Mem[{operand_c}] ({memory[operand_c]})")
+        elif opcode == 66:
+            memory[operand_c] = memory[operand_b]
+            print(f"WRITE: Mem[{operand_c}] = Mem[{operand_b}] ({memory[operand_b]})")
+        elif opcode == 87:
+            reversed_value = int(bin(memory[operand_c])[2:][::-1], 2)
+            memory[operand_b] = reversed_value
+            print(f"BITREV: Mem[{operand_b}] = Reverse(Mem[{operand_c}]) ({reversed_value})")
+        else:
+            raise ValueError(f"Unknown opcode: {opcode}")
+
+
+def generate_program(count, seed=0, address_limit=1 << 18):
+    rng = random.Random(seed)
+    commands = list(COMMANDS)
+    return [(rng.choice(commands), rng.randrange(address_limit), rng.randrange(address_limit))
+            for _ in range(count)]
+
+
+def assemble_program(program):
+    buffer = TempBuffer()
+    for command, operand_b, operand_c in program:
+        process_command(command, operand_b, operand_c, buffer)
+    return bytes(buffer.binary_data)
+
+
+def time_packing(buffer_class, program):
+    buffer = buffer_class()
+    start = time.perf_counter()
+    for command, operand_b, operand_c in program:
+        process_command(command, operand_b, operand_c, buffer)
+    buffer.align_to_bytes()
+    return time.perf_counter() - start, bytes(buffer.binary_data)
+
+
+def run_packing(count):
+    program = generate_program(count)
+    before, reference = time_packing(BitLoopBuffer, program)
+    after, packed = time_packing(TempBuffer, program)
+    if packed != reference:
+        raise AssertionError("Word-level packing differs from the bit loop")
+    print(f"{count} instructions: bit loop {count / before:,.0f} instr/s, "
+          f"word packing {count / after:,.0f} instr/s ({before / after:.1f}x)")
+
+
+def time_execution(run, binary_data):
+    memory = [0] * MEMORY_SIZE
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        run(binary_data, memory)
+        elapsed = time.perf_counter() - start
+    return elapsed, memory
+
+
+def run_interpreter(count):
+    binary_data = assemble_program(generate_program(count, address_limit=MEMORY_SIZE))
+    before, reference = time_execution(bit_loop_execute, binary_data)
+    print(f"{count} instructions: bit loop {count / before:,.0f} instr/s")
+    modes = {
+        "trace off": run,
+        "trace full": lambda data, memory: run(data, memory, Tracer()),
+    }
+    for name, function in modes.items():
+        after, memory = time_execution(function, binary_data)
+        if memory != reference:
+            raise AssertionError("Pre-decoded execution differs from the bit loop")
+        print(f"{' ' * len(str(count))}  pre-decoded, {name}: {count / after:,.0f} instr/s ({before / after:.1f}x)")
+
+
+def generate_vector_program(count, length=8):
+    # Как program.txt: загрузка вектора и поэлементная обработка, повторённые count раз
+    program = []
+    while len(program) < count:
+        base = len(program) % (MEMORY_SIZE - 3 * length)
+        program += [("LOAD", base + i, i + 1) for i in range(length)]
+        program += [("READ", base + length + i, base + i) for i in range(length)]
+        program += [("BITREV", base + 2 * length + i, base + i) for i in range(length)]
+    return program[:count]
+
+
+def run_jit(count):
+    binary_data = assemble_program(generate_vector_program(count))
+    reference = make_memory()
+    start = time.perf_counter()
+    run(binary_data, reference)
+    interpreted = time.perf_counter() - start
+    jit.cache.clear()
+    timings = []
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for _ in range(4):
+            memory = make_memory()
+            start = time.perf_counter()
+            jit.run_compiled(binary_data, memory, cache_dir=cache_dir)
+            timings.append(time.perf_counter() - start)
+            if memory != reference:
+                raise AssertionError("Compiled execution differs from the interpreter")
+            if len(timings) == 1:
+                # Второй запуск — как новый процесс: код читается из каталога кэша
+                jit.cache.clear()
+    cached = min(timings[2:])
+    print(f"{count} instructions: interpreter {count / interpreted:,.0f} instr/s, "
+          f"jit first run {count / timings[0]:,.0f} instr/s ({interpreted / timings[0]:.1f}x), "
+          f"from disk {count / timings[1]:,.0f} instr/s ({interpreted / timings[1]:.1f}x), "
+          f"cached {count / cached:,.0f} instr/s ({interpreted / cached:.1f}x)")
+
+
+def run_bitrev(count, length=512, width=0):
+    # Длинные серии BITREV над соседними ячейками, как в program.txt
+    program = [("LOAD", i, (i * 7919) % (1 << 18)) for i in range(length)]
+    while len(program) < count:
+        program += [("BITREV", length + i, i) for i in range(length)]
+    binary_data = assemble_program(program[:count])
+    program = decode(binary_data)
+    opcodes, operands_b, operands_c = program
+
+    def string_bitrev(memory):
+        for opcode, operand_b, operand_c in zip(opcodes, operands_b, operands_c):
+            if opcode == 87 and width:
+                memory[operand_b] = int(f"{memory[operand_c] & ((1 << width) - 1):0{width}b}"[::-1], 2)
+            elif opcode == 87:
+                memory[operand_b] = int(bin(memory[operand_c])[2:][::-1], 2)
+            else:
+                memory[operand_b] = operand_c
+
+    def table_bitrev(memory):
+        handlers = make_handlers(width)
+        for opcode, operand_b, operand_c in zip(opcodes, operands_b, operands_c):
+            handlers[opcode](memory, operand_b, operand_c)
+
+    results = {}
+    for name, function in (("string", string_bitrev), ("table", table_bitrev),
+                           ("batched", lambda memory: execute(program, memory, width=width))):
+        memory = make_memory()
+        start = time.perf_counter()
+        function(memory)
+        results[name] = (time.perf_counter() - start, memory)
+    reference = results["string"][1]
+    print(f"BITREV width {width or 'significant bits'}:")
+    for name, (elapsed, memory) in results.items():
+        if memory != reference:
+            raise AssertionError(f"{name} BITREV differs from the string version")
+        print(f"{name:>10}: {count / elapsed:,.0f} instr/s ({results['string'][0] / elapsed:.1f}x)")
+
+
+def run_dump(count):
+    memory = make_memory("dense", count)
+    memory[:] = array("q", range(count))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "res.yaml")
+        start = time.perf_counter()
+        with open(path, "w") as f:
+            yaml.dump([{"Address": address, "Value": memory[address]} for address in range(count)], f,
+                      default_flow_style=False)
+        reference = time.perf_counter() - start
+        print(f"{count} cells: yaml.dump {reference:.3f}s")
+        for output_format in ("yaml", "csv", "bin", "npy"):
+            path = os.path.join(tmp, f"res.{output_format}")
+            start = time.perf_counter()
+            write_result(memory, path, (0, count))
+            elapsed = time.perf_counter() - start
+            print(f"{output_format:>8}: {elapsed:.3f}s ({reference / elapsed:.0f}x)")
+
+
+def run_assemble(count):
+    # Прежний путь: двоичный файл, затем повторное чтение исходника для лога
+    program = generate_program(count)
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "program.txt")
+        binary_path = os.path.join(tmp, "out.bin")
+        log_path = os.path.join(tmp, "log.csv")
+        with open(source, "w") as f:
+            f.writelines(f"{command} {operand_b} {operand_c}\n" for command, operand_b, operand_c in program)
+
+        def two_pass():
+            assemble(source, binary_path)
+            log_assembly(source, log_path)
+
+        results = {}
+        for name, function in (("two pass", two_pass),
+                               ("one pass", lambda: assemble(source, binary_path, log_path)),
+                               ("no log", lambda: assemble(source, binary_path))):
+            start = time.perf_counter()
+            function()
+            results[name] = time.perf_counter() - start
+        for name, elapsed in results.items():
+            print(f"{name:>10}: {count / elapsed:,.0f} instr/s ({results['two pass'] / elapsed:.1f}x)")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Assembler and interpreter benchmarks")
+    arg_parser.add_argument("count", nargs="?", type=int, default=100000, help="number of instructions")
+    arg_parser.add_argument("--interpret", action="store_true", help="benchmark the interpreter instead of packing")
+    arg_parser.add_argument("--jit", action="store_true", help="compare compiled execution with the interpreter")
+    arg_parser.add_argument("--bitrev", action="store_true", help="compare BITREV implementations on long runs")
+    arg_parser.add_argument("--dump", action="store_true", help="time writing a memory range in each result format")
+    arg_parser.add_argument("--assemble", action="store_true",
+                            help="compare single-pass assembly with a separate log pass")
+    args = arg_parser.parse_args()
+    if args.assemble:
+        run_assemble(args.count)
+        return
+    if args.dump:
+        run_dump(args.count)
+        return
+    if args.bitrev:
+        run_bitrev(args.count)
+        run_bitrev(args.count, width=18)
+        return
+    if args.jit:
+        run_jit(args.count)
+        return
+    if args.interpret:
+        run_interpreter(args.count)
+        return
+    run_packing(args.count)
+
+
+if __name__ == "__main__":
+    main()
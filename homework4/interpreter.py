@@ -1,85 +1,459 @@
-import yaml
+import argparse
+import json
+import mmap
+import os
 import sys
+from array import array
+from collections import deque
+from functools import lru_cache
+from itertools import islice, repeat
+from operator import and_, rshift, sub
+from sinks import FORMATS, NUMERIC_FORMATS, open_sink, sink_format
 
 MEMORY_SIZE = 1024
 
-class TempBuffer:
-    def __init__(self, binary_data: bytes):
-        self.binary_data = binary_data
-        self.bit_it = 0
+# Полное адресное пространство: operand_b занимает 22 бита
+ADDRESS_SPACE = 1 << 22
+PAGE_BITS = 12
+PAGE_SIZE = 1 << PAGE_BITS
+MEMORY_MODELS = ("dense", "sparse")
 
-    def read(self, bit_width: int) -> int:
-        result = 0
-        for i in range(bit_width):
-            result ^= (((self.binary_data[self.bit_it // 8] >> (self.bit_it % 8)) & 1) << i)
-            self.bit_it += 1
+RESULT_FIELDS = ("Address", "Value")
+RESULT_BATCH = 10000
+
+class SparseMemory:
+    # Память из страниц по PAGE_SIZE слов; страница создаётся при первой записи
+    def __init__(self, size=ADDRESS_SPACE):
+        self.size = size
+        self.pages = {}
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, address):
+        # Граница проверяется всегда: при size, не кратном PAGE_SIZE,
+        # последняя страница выходит за пределы памяти
+        if not 0 <= address < self.size:
+            raise IndexError("memory address out of range")
+        page = self.pages.get(address >> PAGE_BITS)
+        if page is None:
+            return 0
+        return page[address & (PAGE_SIZE - 1)]
+
+    def __setitem__(self, address, value):
+        if not 0 <= address < self.size:
+            raise IndexError("memory address out of range")
+        page = self.pages.get(address >> PAGE_BITS)
+        if page is None:
+            page = self.pages[address >> PAGE_BITS] = array("q", bytes(8 * PAGE_SIZE))
+        page[address & (PAGE_SIZE - 1)] = value
+
+    def values(self, start, end):
+        # Значения диапазона подряд; незатронутые страницы остаются нулями
+        result = array("q", bytes(8 * (end - start)))
+        for number in sorted(self.pages):
+            first = number << PAGE_BITS
+            lo, hi = max(start, first), min(end, first + PAGE_SIZE)
+            if lo < hi:
+                result[lo - start:hi - start] = self.pages[number][lo - first:hi - first]
         return result
 
-def interpret(binary_path: str, resultult_path: str, memory_range: tuple):
-    memory = [0] * MEMORY_SIZE
-    register_accumulator = 0
+    def cells(self, start, end):
+        # Только ячейки затронутых страниц; остальные равны нулю
+        for number in sorted(self.pages):
+            first = number << PAGE_BITS
+            page = self.pages[number]
+            for address in range(max(start, first), min(end, first + PAGE_SIZE)):
+                yield address, page[address - first]
 
-    with open(binary_path, "rb") as f:
-        binary_data = f.read()
+def make_memory(model="dense", size=None):
+    if model == "sparse":
+        return SparseMemory(size or ADDRESS_SPACE)
+    return array("q", bytes(8 * (size or MEMORY_SIZE)))
+
+def memory_cells(memory, start, end):
+    if isinstance(memory, SparseMemory):
+        return memory.cells(start, end)
+    return zip(range(start, end), memory[start:end])
+
+def memory_values(memory, start, end):
+    if isinstance(memory, SparseMemory):
+        return memory.values(start, end)
+    return memory[start:end]
+
+def load(memory, operand_b, operand_c):
+    memory[operand_b] = operand_c
+
+def read(memory, operand_b, operand_c):
+    memory[operand_b] = memory[operand_c]
+
+def write(memory, operand_b, operand_c):
+    memory[operand_c] = memory[operand_b]
+
+# Байт с битами в обратном порядке, для каждого значения байта
+REVERSED_BYTES = bytes(int(f"{byte:08b}"[::-1], 2) for byte in range(256))
+
+# Разрядность BITREV: 0 — число значащих битов значения (исходное поведение,
+# bitrev(6) = bitrev(0b110) = 0b011), иначе младшие width битов слова
+MAX_BITREV_WIDTH = 63
+
+def reverse_bits(value, width=0):
+    if width:
+        value &= (1 << width) - 1
+    reversed_word = int.from_bytes(value.to_bytes(8, "little").translate(REVERSED_BYTES), "big")
+    return reversed_word >> (64 - (width or value.bit_length()))
+
+def reverse_many(values, width=0):
+    # То же для последовательности значений, без цикла по элементам: побайтовая
+    # таблица и разворот всей строки байтов переворачивают весь буфер как одно
+    # большое число (слова при этом идут в обратном порядке). При фиксированной
+    # разрядности сдвиг на 64 - width выполняется сразу для всех слов
+    data = array("q", values)
+    if sys.byteorder == "big":
+        data.byteswap()
+    data = data.tobytes()
+    if width:
+        mask = ((1 << width) - 1).to_bytes(8, "little") * len(values)
+        data = (int.from_bytes(data, "little") & int.from_bytes(mask, "little")).to_bytes(len(data), "little")
+        data = (int.from_bytes(data.translate(REVERSED_BYTES)[::-1], "little") >> (64 - width)).to_bytes(
+            len(data), "little")
+        words = array("q")
+    else:
+        data = data.translate(REVERSED_BYTES)[::-1]
+        words = array("Q")
+    words.frombytes(data)
+    if sys.byteorder == "big":
+        words.byteswap()
+    words.reverse()
+    if width:
+        return words
+    return map(rshift, words, map(sub, repeat(64), map(int.bit_length, values)))
+
+def bitrev(memory, operand_b, operand_c):
+    memory[operand_b] = reverse_bits(memory[operand_c])
+
+# Программа декодируется и выполняется окнами по WINDOW_SIZE байт
+WINDOW_SIZE = 1 << 20
+
+# Таблица обработчиков по опкоду
+HANDLERS = {
+    86: load,
+    58: read,
+    66: write,
+    87: bitrev,
+}
+
+NAMES = {86: "LOAD", 58: "READ", 66: "WRITE", 87: "BITREV"}
+
+def make_handlers(width=0):
+    if not width:
+        return HANDLERS
+    def bitrev_width(memory, operand_b, operand_c):
+        memory[operand_b] = reverse_bits(memory[operand_c], width)
+    return {**HANDLERS, 87: bitrev_width}
+
+TRACE_MODES = ("off", "sampled", "full")
+
+# Сколько записей трассировки копится перед записью в файл
+TRACE_FLUSH = 4096
+
+def format_trace(opcode, operand_b, operand_c, value):
+    if opcode == 86:
+        return f"LOAD: Mem[{operand_b}] = {operand_c}"
+    elif opcode == 58:
+        return f"READ: Mem[{operand_b}] = Mem[{operand_c}] ({value})"
+    elif opcode == 66:
+        return f"WRITE: Mem[{operand_c}] = Mem[{operand_b}] ({value})"
+    return f"BITREV: Mem[{operand_b}] = Reverse(Mem[{operand_c}]) ({value})"
+
+class Tracer:
+    # Записи хранятся как кортежи и форматируются только при выводе.
+    # При last > 0 хранятся только последние last команд (кольцевой буфер),
+    # они выводятся в конце работы или при ошибке.
+    def __init__(self, output=None, rate=1, last=0):
+        self.output = output
+        self.rate = rate
+        self.last = last
+        self.records = deque(maxlen=last or None)
+
+    def record(self, index, opcode, operand_b, operand_c, memory):
+        if index % self.rate:
+            return
+        value = memory[operand_c if opcode == 66 else operand_b]
+        self.records.append((index, opcode, operand_b, operand_c, value))
+        if not self.last and len(self.records) >= TRACE_FLUSH:
+            self.flush()
 
-    buffer = TempBuffer(binary_data)
+    def flush(self):
+        if self.output is None:
+            lines = [format_trace(*record[1:]) + "\n" for record in self.records]
+            sys.stdout.write("".join(lines))
+        else:
+            lines = [json.dumps({"index": index, "command": NAMES[opcode], "operand_b": operand_b,
+                                 "operand_c": operand_c, "value": value}) + "\n"
+                     for index, opcode, operand_b, operand_c, value in self.records]
+            self.output.write("".join(lines))
+        self.records.clear()
+
+    def close(self):
+        self.flush()
+        if self.output is not None:
+            self.output.close()
+
+# Таблицы для проверки байтов команд целиком через bytes.translate
+OPCODE_BYTE = bytes(byte & 0x7F for byte in range(256))
+INVALID_OPCODE = bytes(opcode not in HANDLERS for opcode in range(128)) + bytes(128)
+HIGH_BIT = bytes(byte >> 7 for byte in range(256))
+NONZERO = bytes(byte != 0 for byte in range(256))
+
+def first_set(flags):
+    index = flags.find(1)
+    return len(flags) if index == -1 else index
+
+def decode(binary_data):
+    # Программа разбирается один раз: каждая команда — 64-битное слово
+    # (7 бит опкода, 22 бита operand_b, 18 бит operand_c, 17 бит нулей).
+    # Поля выделяются для всего окна сразу: байты с шагом 8 и map по словам
+    if len(binary_data) % 8 != 0:
+        raise ValueError("Truncated instruction.")
+    with memoryview(binary_data) as view:
+        opcodes = bytes(view[0::8]).translate(OPCODE_BYTE)
+        bad_opcode = first_set(opcodes.translate(INVALID_OPCODE))
+        # Биты выравнивания: старший бит байта 5 и байты 6, 7
+        bad_padding = min(first_set(bytes(view[5::8]).translate(HIGH_BIT)),
+                          first_set(bytes(view[6::8]).translate(NONZERO)),
+                          first_set(bytes(view[7::8]).translate(NONZERO)))
+        if bad_opcode <= bad_padding and bad_opcode < len(opcodes):
+            raise ValueError(f"Unknown opcode: {opcodes[bad_opcode]}")
+        if bad_padding < len(opcodes):
+            raise ValueError("Unexpected padding bits.")
+        words = array("Q")
+        words.frombytes(view)
+    if sys.byteorder == "big":
+        words.byteswap()
+    operands_b = array("Q", map(and_, map(rshift, words, repeat(7)), repeat(0x3FFFFF)))
+    operands_c = array("Q", map(rshift, words, repeat(29)))
+    return array("B", opcodes), operands_b, operands_c
+
+def memory_kind(memory):
+    # Срезами можно работать только с list и array; для прочей памяти — None
+    if type(memory) is array:
+        return memory.typecode
+    if type(memory) is list:
+        return "list"
+    return None
+
+IS_LOAD = bytes(byte == 86 for byte in range(256))
+
+def run_breaks(opcodes, operands_b, operands_c):
+    # breaks[i] == 0, если команда i + 1 продолжает серию команды i: тот же
+    # опкод и адреса на единицу больше (у LOAD поле C — константа). Все соседние
+    # пары сравниваются сразу: массив читается как одно большое число,
+    # сдвигается на один элемент и вычитается или складывается по XOR
+    count = len(opcodes) - 1
+    if count <= 0:
+        return b""
+    codes = int.from_bytes(opcodes.tobytes(), "little")
+    changed = ((codes >> 8) ^ codes).to_bytes(count + 1, "little")[:count].translate(NONZERO)
+    is_load = opcodes[:-1].tobytes().translate(IS_LOAD)
+    breaks = (int.from_bytes(changed, "little") | steps(operands_b, count)
+              | (steps(operands_c, count) & ~int.from_bytes(is_load, "little")))
+    return breaks.to_bytes(count, "little")
+
+@lru_cache(maxsize=4)
+def lane_constants(count):
+    ones = int.from_bytes(b"\1\0\0\0\0\0\0\0" * count, "little")
+    return ones << 62, ones * ((1 << 62) + 1), (1 << (64 * count)) - 1
+
+def steps(values, count):
+    # Байт i равен 1, если values[i + 1] != values[i] + 1. Значения лежат в
+    # 64-битных полях; смещение 2**62 в каждом поле исключает заёмы между полями
+    words = values if values.typecode == "Q" else array("Q", values)
+    if sys.byteorder == "big":
+        words = array("Q", words)
+        words.byteswap()
+    x = int.from_bytes(words.tobytes(), "little")
+    offset, expected, mask = lane_constants(count)
+    diff = ((x >> 64) + offset - (x & mask)) ^ expected
+    # Младший байт каждого поля собирает все его биты
+    diff |= diff >> 32
+    diff |= diff >> 16
+    diff |= diff >> 8
+    return int.from_bytes(diff.to_bytes(8 * count, "little")[::8].translate(NONZERO), "little")
+
+def run_length(breaks, start):
+    # Длина серии, начинающейся с команды start
+    end = breaks.find(1, start)
+    return (len(breaks) if end == -1 else end) - start + 1
+
+def fusable(opcode, operand_b, operand_c, length, size):
+    # Серию можно выполнить операцией над срезами, если адреса в пределах памяти
+    # и результат совпадает с покомандным выполнением
+    if length < 2 or operand_b + length > size:
+        return False
+    if opcode == 86:
+        return True
+    if operand_c + length > size:
+        return False
+    target, source = (operand_c, operand_b) if opcode == 66 else (operand_b, operand_c)
+    return target <= source or target >= source + length
+
+def execute_run(memory, kind, opcode, operand_b, operand_c, length, values, width=0):
+    if opcode == 86:
+        memory[operand_b:operand_b + length] = list(values) if kind == "list" else array(kind, values)
+    elif opcode == 58:
+        memory[operand_b:operand_b + length] = memory[operand_c:operand_c + length]
+    elif opcode == 66:
+        memory[operand_c:operand_c + length] = memory[operand_b:operand_b + length]
+    else:
+        reversed_values = reverse_many(memory[operand_c:operand_c + length], width)
+        if kind == "list":
+            reversed_values = list(reversed_values)
+        elif type(reversed_values) is not array:
+            reversed_values = array(kind, reversed_values)
+        memory[operand_b:operand_b + length] = reversed_values
+
+def execute(program, memory, tracer=None, index=0, width=0):
+    # index — порядковый номер первой команды окна, нужен для трассировки
+    handlers = make_handlers(width)
+    if tracer is None:
+        kind = memory_kind(memory)
+        if kind is None:
+            for opcode, operand_b, operand_c in zip(*program):
+                handlers[opcode](memory, operand_b, operand_c)
+        else:
+            execute_runs(program, memory, kind, handlers, width)
+        return
+    for index, (opcode, operand_b, operand_c) in enumerate(zip(*program), index):
+        handlers[opcode](memory, operand_b, operand_c)
+        tracer.record(index, opcode, operand_b, operand_c, memory)
+
+def execute_runs(program, memory, kind, handlers, width=0):
+    # Серии команд над соседними адресами выполняются операциями над срезами
+    opcodes, operands_b, operands_c = program
+    breaks = run_breaks(opcodes, operands_b, operands_c)
+    size = len(memory)
+    count = len(opcodes)
     i = 0
-    while buffer.bit_it < len(binary_data) * 8:  # Используем точное количество бит
-        opcode = buffer.read(7)  # Длина opcode
-        if opcode == 86:  # LOAD
-            operand_b = buffer.read(22)  # Адрес
-            operand_c = buffer.read(18)  # Константа
-            if buffer.read(17) != 0:  # Проверка на корректность выравнивания
-                raise ValueError("Unexpected padding bits.")
-            register_accumulator = operand_c
-            memory[operand_b] = register_accumulator
-            print(f"LOAD: Mem[{operand_b}] = {operand_c}")
-        elif opcode == 58:  # READ
-            operand_b = buffer.read(22)
-            operand_c = buffer.read(18)
-            if buffer.read(17) != 0:
-                raise ValueError("Unexpected padding bits.")
-            register_accumulator = memory[operand_c]
-            memory[operand_b] = register_accumulator
-            print(f"READ: Mem[{operand_b}] = Mem[{operand_c}] ({memory[operand_c]})")
-        elif opcode == 66:  # WRITE
-            operand_b = buffer.read(22)
-            operand_c = buffer.read(18)
-            if buffer.read(17) != 0:
-                raise ValueError("Unexpected padding bits.")
-            memory[operand_c] = memory[operand_b]
-            print(f"WRITE: Mem[{operand_c}] = Mem[{operand_b}] ({memory[operand_b]})")
-        elif opcode == 87:  # BITREV
-            operand_b = buffer.read(22)
-            operand_c = buffer.read(18)
-            if buffer.read(17) != 0:
-                raise ValueError("Unexpected padding bits.")
-            reversed_value = int(bin(memory[operand_c])[2:][::-1], 2)
-            memory[operand_b] = reversed_value
-            print(f"BITREV: Mem[{operand_b}] = Reverse(Mem[{operand_c}]) ({reversed_value})")
+    while i < count:
+        opcode, operand_b, operand_c = opcodes[i], operands_b[i], operands_c[i]
+        if i < count - 1 and not breaks[i]:
+            length = run_length(breaks, i)
+            if fusable(opcode, operand_b, operand_c, length, size):
+                execute_run(memory, kind, opcode, operand_b, operand_c, length,
+                            operands_c[i:i + length], width)
+            else:
+                for j in range(i, i + length):
+                    handlers[opcode](memory, operands_b[j], operands_c[j])
+            i += length
+            continue
+        handlers[opcode](memory, operand_b, operand_c)
+        i += 1
+
+def run(binary_data, memory, tracer=None, width=0):
+    # binary_data читается окнами без копирования, так что размер декодированной
+    # программы в памяти не зависит от длины файла
+    index = 0
+    try:
+        with memoryview(binary_data) as view:
+            for offset in range(0, len(view), WINDOW_SIZE):
+                with view[offset:offset + WINDOW_SIZE] as window:
+                    program = decode(window)
+                execute(program, memory, tracer, index, width)
+                index += len(program[0])
+    finally:
+        if tracer is not None:
+            tracer.close()
+
+def make_tracer(mode, trace_file=None, rate=1000, last=0):
+    if mode == "off":
+        return None
+    output = None if trace_file is None else open(trace_file, "w", buffering=1 << 16)
+    return Tracer(output, rate if mode == "sampled" else 1, last)
+
+def write_result(memory, resultult_path, memory_range, output_format=None):
+    # Двоичные форматы получают значения всего диапазона одним массивом
+    # (адрес — start плюс номер значения), текстовые — пары адрес/значение порциями
+    start, end = memory_range
+    output_format = sink_format(resultult_path, output_format)
+    if output_format in NUMERIC_FORMATS:
+        with open_sink(resultult_path, ("Value",), output_format) as sink:
+            sink.write_values(memory_values(memory, start, end))
+        return
+    with open_sink(resultult_path, RESULT_FIELDS, output_format) as sink:
+        cells = memory_cells(memory, start, end)
+        while True:
+            rows = list(islice(cells, RESULT_BATCH))
+            if not rows:
+                break
+            sink.write(rows)
+
+def run_file(binary_path, memory, tracer=None, jit=False, width=0, jit_cache=None):
+    execute_binary = lambda binary_data, memory, tracer: run(binary_data, memory, tracer, width)
+    if jit:
+        from jit import run_compiled
+        execute_binary = lambda binary_data, memory, tracer: run_compiled(binary_data, memory, width, jit_cache)
+
+    # Файл отображается в память; пустой файл mmap не поддерживает
+    with open(binary_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as binary_data:
+                execute_binary(binary_data, memory, tracer)
         else:
-            raise ValueError(f"Unknown opcode: {opcode}")
+            execute_binary(b"", memory, tracer)
+
+def interpret(binary_path: str, resultult_path: str, memory_range: tuple, tracer=None, memory=None, jit=False,
+              width=0, output_format=None, jit_cache=None):
+    if memory is None:
+        memory = make_memory()
+    run_file(binary_path, memory, tracer, jit, width, jit_cache)
 
-    # Записываем данные памяти в YAML файл
-    result_data = [{"Address": addr, "Value": memory[addr]} for addr in range(*memory_range)]
-    with open(resultult_path, 'w') as yamlfile:
-        yaml.dump(result_data, yamlfile, default_flow_style=False)
+    # Записываем данные памяти в файл результата
+    write_result(memory, resultult_path, memory_range, output_format)
 
 if __name__ == "__main__":
-    if len(sys.argv) != 5:
-        print("Usage: python script.py <binary_file> <resultult_file> <memory_start> <memory_end>")
-        sys.exit(1)
+    arg_parser = argparse.ArgumentParser(description="Interpreter for the educational VM")
+    arg_parser.add_argument("binary_file")
+    arg_parser.add_argument("resultult_file")
+    arg_parser.add_argument("memory_start")
+    arg_parser.add_argument("memory_end")
+    arg_parser.add_argument("--format", choices=FORMATS,
+                            help="result format; by default taken from the file extension, yaml otherwise")
+    arg_parser.add_argument("--memory", choices=MEMORY_MODELS, default="dense",
+                            help="dense array or sparse pages covering the full address space")
+    arg_parser.add_argument("--memory-size", type=int,
+                            help=f"number of memory words (default {MEMORY_SIZE} dense, {ADDRESS_SPACE} sparse)")
+    arg_parser.add_argument("--bitrev-width", type=int, default=0,
+                            help=f"reverse the low N bits (1-{MAX_BITREV_WIDTH}); 0 reverses the significant bits")
+    arg_parser.add_argument("--jit", action="store_true",
+                            help="compile the program into Python functions before running it")
+    arg_parser.add_argument("--jit-cache", metavar="DIR",
+                            help="keep compiled code in DIR so that later --jit runs skip compilation")
+    arg_parser.add_argument("--trace", choices=TRACE_MODES, default="off",
+                            help="off, every N-th instruction (sampled) or every instruction (full)")
+    arg_parser.add_argument("--trace-file", help="write the trace as JSONL instead of printing it")
+    arg_parser.add_argument("--trace-rate", type=int, default=1000, help="sampling interval for --trace sampled")
+    arg_parser.add_argument("--trace-last", type=int, default=0,
+                            help="keep only the last N trace records and write them at exit or on error")
+    args = arg_parser.parse_args()
+    if args.jit and args.trace != "off":
+        arg_parser.error("--jit cannot be combined with --trace")
+    if args.jit_cache and not args.jit:
+        arg_parser.error("--jit-cache requires --jit")
+    if not 0 <= args.bitrev_width <= MAX_BITREV_WIDTH:
+        arg_parser.error(f"--bitrev-width must be between 0 and {MAX_BITREV_WIDTH}")
 
-    binary_file = sys.argv[1]
-    resultult_file = sys.argv[2]
     try:
-        memory_start, memory_end = int(sys.argv[3]), int(sys.argv[4])
+        memory_start, memory_end = int(args.memory_start), int(args.memory_end)
     except ValueError:
         print("Memory range must be two integers.")
         sys.exit(1)
 
-    if not (0 <= memory_start < MEMORY_SIZE and 0 <= memory_end <= MEMORY_SIZE and memory_start < memory_end):
+    memory = make_memory(args.memory, args.memory_size)
+    if not (0 <= memory_start < len(memory) and 0 <= memory_end <= len(memory) and memory_start < memory_end):
         print("Invalid memory range.")
         sys.exit(1)
 
-    interpret(binary_file, resultult_file, (memory_start, memory_end))
+    tracer = make_tracer(args.trace, args.trace_file, args.trace_rate, args.trace_last)
+    interpret(args.binary_file, args.resultult_file, (memory_start, memory_end), tracer, memory, args.jit,
+              args.bitrev_width, args.format, args.jit_cache)
@@ -0,0 +1,178 @@
+import hashlib
+import marshal
+import os
+from array import array
+from collections import OrderedDict
+from functools import partial
+from importlib.util import MAGIC_NUMBER
+from pathlib import Path
+from types import FunctionType
+from interpreter import WINDOW_SIZE, decode, fusable, memory_kind, reverse_bits, reverse_many, run_breaks, run_length
+
+# Окно программы переводится в функции Python по BLOCK_SIZE команд;
+# скомпилированные окна кэшируются по хэшу их байтов. Разрядность BITREV
+# в код не входит: функции rev и revs передаются при вызове
+BLOCK_SIZE = 1024
+# Предел считается по размеру marshal; в памяти окно занимает примерно вдвое больше
+CACHE_SIZE = 32 * 1024 * 1024
+DISK_CACHE_SIZE = 256 * 1024 * 1024
+
+LOAD, READ, WRITE, BITREV = 86, 58, 66, 87
+
+
+class CodeCache:
+    # LRU скомпилированных окон в процессе, ограниченный суммарным размером
+    # сериализованного кода и констант. С каталогом окна сохраняются на диск
+    # через marshal, и следующий запуск не платит за компиляцию
+    def __init__(self, max_size=CACHE_SIZE, disk_size=DISK_CACHE_SIZE):
+        self.windows = OrderedDict()
+        self.size = 0
+        self.max_size = max_size
+        self.disk_size = disk_size
+
+    def __len__(self):
+        return len(self.windows)
+
+    def clear(self):
+        self.windows.clear()
+        self.size = 0
+
+    def get(self, key, kind, cache_dir=None):
+        entry = self.windows.get(key)
+        if entry is not None:
+            self.windows.move_to_end(key)
+            return entry[0]
+        if cache_dir is None:
+            return None
+        path = Path(cache_dir, f"{key}.marshal")
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # Время изменения служит отметкой последнего использования для LRU
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        blocks = load_blocks(data, kind)
+        self.add(key, blocks, len(data))
+        return blocks
+
+    def put(self, key, blocks, kind, cache_dir=None):
+        data = dump_blocks(blocks, kind)
+        self.add(key, blocks, len(data))
+        if cache_dir is not None:
+            cache_dir = Path(cache_dir)
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            # Запись через временный файл: параллельные процессы не видят обрывков
+            tmp_path = cache_dir / f"{key}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, cache_dir / f"{key}.marshal")
+            self.evict(cache_dir)
+
+    def add(self, key, blocks, size):
+        self.windows[key] = blocks, size
+        self.size += size
+        while self.size > self.max_size and len(self.windows) > 1:
+            _, (_, evicted) = self.windows.popitem(last=False)
+            self.size -= evicted
+
+    def evict(self, cache_dir):
+        entries = []
+        total = 0
+        for path in cache_dir.glob("*.marshal"):
+            stat = path.stat()
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.disk_size:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+
+cache = CodeCache()
+
+
+def window_key(window, kind, size):
+    # Формат marshal для кода зависит от версии Python, она входит в ключ
+    digest = hashlib.blake2b(f"{kind}:{size}:".encode() + MAGIC_NUMBER, digest_size=16)
+    digest.update(window)
+    return digest.hexdigest()
+
+
+def dump_blocks(blocks, kind):
+    return marshal.dumps([(block.__code__, constants if kind == "list" else [c.tobytes() for c in constants])
+                          for block, constants in blocks])
+
+
+def load_blocks(data, kind):
+    return [(FunctionType(code, {}), constants if kind == "list" else [array(kind, c) for c in constants])
+            for code, constants in marshal.loads(data)]
+
+
+def run_compiled(binary_data, memory, width=0, cache_dir=None):
+    kind, size = memory_kind(memory), len(memory)
+    rev = partial(reverse_bits, width=width)
+    if kind == "list":
+        revs = lambda values: list(reverse_many(values, width))
+    elif width and kind == "q":
+        revs = partial(reverse_many, width=width)
+    else:
+        revs = lambda values: array(kind, reverse_many(values))
+    with memoryview(binary_data) as view:
+        for offset in range(0, len(view), WINDOW_SIZE):
+            with view[offset:offset + WINDOW_SIZE] as window:
+                blocks = compile_window(window, kind, size, cache_dir)
+            for block, constants in blocks:
+                block(memory, constants, rev, revs)
+
+
+def compile_window(window, kind, size, cache_dir=None):
+    key = window_key(window, kind, size)
+    blocks = cache.get(key, kind, cache_dir)
+    if blocks is not None:
+        return blocks
+    opcodes, operands_b, operands_c = decode(window)
+    blocks = [compile_block(opcodes[start:start + BLOCK_SIZE], operands_b[start:start + BLOCK_SIZE],
+                            operands_c[start:start + BLOCK_SIZE], kind, size)
+              for start in range(0, len(opcodes), BLOCK_SIZE)]
+    cache.put(key, blocks, kind, cache_dir)
+    return blocks
+
+
+def compile_block(opcodes, operands_b, operands_c, kind, size):
+    lines = ["def block(m, K, rev, revs):"]
+    constants = []
+    breaks = run_breaks(opcodes, operands_b, operands_c)
+    i = 0
+    while i < len(opcodes):
+        opcode, operand_b, operand_c = opcodes[i], operands_b[i], operands_c[i]
+        length = run_length(breaks, i) if kind else 1
+        if kind and fusable(opcode, operand_b, operand_c, length, size):
+            if opcode == LOAD:
+                values = operands_c[i:i + length]
+                constants.append(list(values) if kind == "list" else array(kind, values))
+                lines.append(f"    m[{operand_b}:{operand_b + length}] = K[{len(constants) - 1}]")
+            elif opcode == READ:
+                lines.append(f"    m[{operand_b}:{operand_b + length}] = m[{operand_c}:{operand_c + length}]")
+            elif opcode == WRITE:
+                lines.append(f"    m[{operand_c}:{operand_c + length}] = m[{operand_b}:{operand_b + length}]")
+            else:
+                lines.append(f"    m[{operand_b}:{operand_b + length}] = revs(m[{operand_c}:{operand_c + length}])")
+            i += length
+            continue
+        if opcode == LOAD:
+            lines.append(f"    m[{operand_b}] = {operand_c}")
+        elif opcode == READ:
+            lines.append(f"    m[{operand_b}] = m[{operand_c}]")
+        elif opcode == WRITE:
+            lines.append(f"    m[{operand_c}] = m[{operand_b}]")
+        else:
+            lines.append(f"    m[{operand_b}] = rev(m[{operand_c}])")
+        i += 1
+    if len(lines) == 1:
+        lines.append("    pass")
+    namespace = {}
+    exec(compile("\n".join(lines), "<jit>", "exec"), namespace)
+    return namespace["block"], constants
@@ -0,0 +1,126 @@
+import csv
+import os
+import struct
+import sys
+from array import array
+import yaml
+
+# Форматы файлов результата и лога; по умолчанию выбираются по расширению
+FORMATS = ("yaml", "csv", "bin", "npy")
+NUMERIC_FORMATS = ("bin", "npy")
+EXTENSIONS = {".yaml": "yaml", ".yml": "yaml", ".csv": "csv", ".bin": "bin", ".npy": "npy"}
+
+Dumper = getattr(yaml, "CDumper", yaml.Dumper)
+
+# Заголовок .npy дополняется до фиксированной длины, чтобы форму массива
+# можно было записать после данных
+NPY_MAGIC = b"\x93NUMPY\x01\x00"
+NPY_HEADER_SIZE = 128
+
+
+def sink_format(path, output_format=None):
+    if output_format is not None:
+        return output_format
+    return EXTENSIONS.get(os.path.splitext(path)[1].lower(), "yaml")
+
+
+def open_sink(path, fields, output_format=None):
+    return SINKS[sink_format(path, output_format)](path, fields)
+
+
+class Sink:
+    # Строки принимаются порциями; числовые форматы хранят только целые
+    numeric = False
+    newline = None
+
+    def __init__(self, path, fields):
+        self.fields = fields
+        self.file = open(path, "wb") if self.numeric else open(path, "w", newline=self.newline)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+
+class YamlSink(Sink):
+    def __init__(self, path, fields):
+        super().__init__(path, fields)
+        self.written = False
+
+    def write(self, rows):
+        data = [dict(zip(self.fields, row)) for row in rows]
+        if data:
+            # Блочные списки YAML можно склеивать
+            yaml.dump(data, self.file, Dumper=Dumper, default_flow_style=False)
+            self.written = True
+
+    def close(self):
+        if not self.written:
+            yaml.dump([], self.file, Dumper=Dumper, default_flow_style=False)
+        super().close()
+
+
+class CsvSink(Sink):
+    newline = ""
+
+    def __init__(self, path, fields):
+        super().__init__(path, fields)
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(fields)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+
+class BinarySink(Sink):
+    # Значения подряд как 64-битные целые little-endian, строка за строкой
+    numeric = True
+
+    def __init__(self, path, fields):
+        super().__init__(path, fields)
+        self.count = 0
+
+    def write(self, rows):
+        if len(self.fields) == 1:
+            values = array("q", (row[0] for row in rows))
+        else:
+            values = array("q", (value for row in rows for value in row))
+        self.write_values(values)
+
+    def write_values(self, values):
+        if type(values) is not array or values.typecode != "q":
+            values = array("q", values)
+        if sys.byteorder == "big":
+            values = array("q", values)
+            values.byteswap()
+        self.file.write(values.tobytes())
+        self.count += len(values)
+
+
+class NpySink(BinarySink):
+    # Формат .npy: заголовок с описанием массива int64 и данные как у BinarySink
+    def __init__(self, path, fields):
+        super().__init__(path, fields)
+        self.file.write(bytes(NPY_HEADER_SIZE))
+
+    def close(self):
+        rows = self.count // len(self.fields)
+        shape = f"({rows},)" if len(self.fields) == 1 else f"({rows}, {len(self.fields)})"
+        header = f"{{'descr': '<i8', 'fortran_order': False, 'shape': {shape}, }}"
+        size = NPY_HEADER_SIZE - len(NPY_MAGIC) - 2
+        self.file.seek(0)
+        self.file.write(NPY_MAGIC + struct.pack("<H", size) + header.ljust(size - 1).encode("latin1") + b"\n")
+        super().close()
+
+
+SINKS = {
+    "yaml": YamlSink,
+    "csv": CsvSink,
+    "bin": BinarySink,
+    "npy": NpySink,
+}
@@ -1,7 +1,17 @@
+import json
+import os
+import tempfile
 import unittest
 from unittest.mock import patch, mock_open
 from io import StringIO
 from assembler import TempBuffer, assemble, log_assembly, process_command, COMMANDS
+from interpreter import MEMORY_SIZE, reverse_bits, reverse_many, PAGE_SIZE, SparseMemory, Tracer, decode, execute, run, interpret, make_memory, memory_cells, write_result
+from jit import CodeCache, cache, run_compiled
+from batch import find_programs, run_batch
+from sinks import open_sink
+import csv
+import struct
+import random
 import yaml
 
 
@@ -90,9 +100,364 @@ class TestAssembler(unittest.TestCase):
         self.assertEqual(buffer.binary_data[5:8], (0).to_bytes(3, byteorder='big'))
         self.assertEqual(buffer.binary_data[5:8], (0).to_bytes(3, byteorder='big'))
     
+    def test_instruction_bytes(self):
+        buffer = TempBuffer()
+        process_command("LOAD", 964, 740, buffer)
+        self.assertEqual(bytes(buffer.binary_data), bytes([0x56, 0xE2, 0x01, 0x80, 0x5C, 0x00, 0x00, 0x00]))
+
+    def test_unaligned_write(self):
+        buffer = TempBuffer()
+        buffer.write(5, 3)
+        buffer.write(0x1FF, 9)
+        buffer.write(1, 1)
+        buffer.align_to_bytes()
+        self.assertEqual(bytes(buffer.binary_data), bytes([0xFD, 0x1F]))
+        self.assertEqual(buffer.bit_size, 16)
+
+    @patch("assembler.LOG_BATCH", 3)
+    @patch("assembler.FLUSH_SIZE", 8)
+    def test_streaming_assemble(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            binary_path = os.path.join(tmp, "out.bin")
+            log_path = os.path.join(tmp, "log.yaml")
+            assemble("program.txt", binary_path, log_path)
+            with open(binary_path, "rb") as f, open("out.bin", "rb") as expected:
+                self.assertEqual(f.read(), expected.read())
+            with open(log_path) as f:
+                self.assertEqual(yaml.safe_load(f), self.expected_log)
+
+    @patch("assembler.log_assembly")
+    def test_single_pass(self, log_assembly):
+        with tempfile.TemporaryDirectory() as tmp:
+            binary_path = os.path.join(tmp, "out.bin")
+            log_path = os.path.join(tmp, "log.csv")
+            assemble("program.txt", binary_path, log_path)
+            log_assembly.assert_not_called()
+            with open(log_path, newline="") as f:
+                rows = list(csv.DictReader(f))
+            self.assertEqual([(row["Command"], int(row["Operand_B"]), int(row["Operand_C"])) for row in rows],
+                             [(row["Command"], row["Operand_B"], row["Operand_C"]) for row in self.expected_log])
+
+            assemble("program.txt", binary_path)
+            with open(binary_path, "rb") as f, open("out.bin", "rb") as expected:
+                self.assertEqual(f.read(), expected.read())
+
+    @patch("assembler.LOG_BATCH", 1)
+    def test_single_pass_error(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, "bad.txt")
+            log_path = os.path.join(tmp, "log.yaml")
+            with open(source, "w") as f:
+                f.write("LOAD 1 2\nLOAD 3 4\nJUMP 3 4\n")
+            with open(log_path, "w") as f:
+                yaml.safe_dump(self.expected_log, f)
+            with self.assertRaises(ValueError):
+                assemble(source, os.path.join(tmp, "out.bin"), log_path)
+            # Уже записанные порции лога не заменяют прежний лог
+            with open(log_path) as f:
+                self.assertEqual(yaml.safe_load(f), self.expected_log)
+            self.assertEqual(sorted(os.listdir(tmp)), ["bad.txt", "log.yaml"])
+
+    def test_error_keeps_previous_binary(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, "bad.txt")
+            binary_path = os.path.join(tmp, "out.bin")
+            with open(source, "w") as f:
+                f.write("LOAD 1 2\nJUMP 3 4\n")
+            with open(binary_path, "wb") as f:
+                f.write(b"previous")
+            with self.assertRaises(ValueError):
+                assemble(source, binary_path)
+            with open(binary_path, "rb") as f:
+                self.assertEqual(f.read(), b"previous")
+            self.assertEqual(sorted(os.listdir(tmp)), ["bad.txt", "out.bin"])
+
     def test_programm(self):
         assemble("mock_programm.txt", "mock_out.bin", "mock_log.yaml")
         
 
+def assemble_commands(*commands):
+    buffer = TempBuffer()
+    for command in commands:
+        process_command(*command, buffer)
+    return bytes(buffer.binary_data)
+
+
+def random_program(rng, count, size):
+    # Серии с соседними адресами, чтобы проверить объединение команд
+    buffer = TempBuffer()
+    while count > 0:
+        command = rng.choice(list(COMMANDS))
+        length = rng.choice([1, 1, 3, 20])
+        operand_b, operand_c = rng.randrange(size - length), rng.randrange(size - length)
+        for i in range(length):
+            process_command(command, operand_b + i, operand_c + (i if command != "LOAD" else rng.randrange(50)),
+                            buffer)
+        count -= length
+    return bytes(buffer.binary_data)
+
+
+class TestInterpreter(unittest.TestCase):
+    def test_execute(self):
+        program = decode(assemble_commands(("LOAD", 0, 6), ("READ", 1, 0), ("WRITE", 1, 2), ("BITREV", 3, 2)))
+        self.assertEqual(list(program[0]), [86, 58, 66, 87])
+        memory = [0] * MEMORY_SIZE
+        with patch("sys.stdout", new_callable=StringIO) as output:
+            execute(program, memory)
+        self.assertEqual(memory[:4], [6, 6, 6, 3])
+        self.assertEqual(output.getvalue(), "")
+
+    def test_trace(self):
+        program = assemble_commands(*[("LOAD", i, i + 1) for i in range(10)], ("BITREV", 20, 5))
+        with patch("sys.stdout", new_callable=StringIO) as output:
+            run(program, [0] * MEMORY_SIZE, Tracer(rate=5))
+        self.assertEqual(output.getvalue().splitlines(),
+                         ["LOAD: Mem[0] = 1", "LOAD: Mem[5] = 6", "BITREV: Mem[20] = Reverse(Mem[5]) (3)"])
+
+    def test_trace_ring_buffer_on_error(self):
+        program = assemble_commands(*[("LOAD", i, i) for i in range(5)], ("READ", 0, MEMORY_SIZE))
+        output = StringIO()
+        output.close = lambda: None
+        with self.assertRaises(IndexError):
+            run(program, [0] * MEMORY_SIZE, Tracer(output, last=2))
+        records = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual([record["index"] for record in records], [3, 4])
+        self.assertEqual(records[-1], {"index": 4, "command": "LOAD", "operand_b": 4, "operand_c": 4, "value": 4})
+
+    def test_decode_errors(self):
+        with self.assertRaisesRegex(ValueError, "Unknown opcode: 1"):
+            decode(assemble_commands(("LOAD", 0, 6)) + (1).to_bytes(8, "little"))
+        with self.assertRaisesRegex(ValueError, "Unexpected padding bits"):
+            decode((86 | 1 << 50).to_bytes(8, "little"))
+        with self.assertRaisesRegex(ValueError, "Unexpected padding bits"):
+            decode((86 | 1 << 47).to_bytes(8, "little") + (1).to_bytes(8, "little"))
+        with self.assertRaisesRegex(ValueError, "Unknown opcode: 127"):
+            decode((127 | 1 << 63).to_bytes(8, "little"))
+        with self.assertRaisesRegex(ValueError, "Truncated instruction"):
+            decode(assemble_commands(("LOAD", 0, 6))[:5])
+
+
+    @patch("interpreter.WINDOW_SIZE", 16)
+    def test_interpret_windows(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            binary_path = os.path.join(tmp, "out.bin")
+            result_path = os.path.join(tmp, "res.yaml")
+            with open(binary_path, "wb") as f:
+                f.write(assemble_commands(*[("LOAD", i, i + 1) for i in range(5)], ("READ", 5, 0)))
+            interpret(binary_path, result_path, (0, 6))
+            with open(result_path) as f:
+                values = [item["Value"] for item in yaml.safe_load(f)]
+            self.assertEqual(values, [1, 2, 3, 4, 5, 1])
+            open(binary_path, "wb").close()
+            interpret(binary_path, result_path, (0, 1))
+
+
+    def test_reverse_bits(self):
+        for value in list(range(300)) + [(1 << 18) - 1, 123456, (1 << 62) + 5]:
+            self.assertEqual(reverse_bits(value), int(bin(value)[2:][::-1], 2))
+            self.assertEqual(reverse_bits(value, 18), int(f"{value & 0x3FFFF:018b}"[::-1], 2))
+        self.assertEqual(reverse_bits(1, 63), 1 << 62)
+        values = [0, 1, 6, 740, (1 << 62) + 5]
+        for width in (0, 8, 63):
+            self.assertEqual(list(reverse_many(values, width)), [reverse_bits(value, width) for value in values])
+
+    def test_batched_runs_match_single_steps(self):
+        rng = random.Random(17)
+        for _ in range(30):
+            binary_data = random_program(rng, 500, 64)
+            for width in (0, 5):
+                expected = make_memory("sparse", 64)
+                run(binary_data, expected, width=width)
+                for memory in (make_memory("dense", 64), [0] * 64):
+                    run(binary_data, memory, width=width)
+                    self.assertEqual(list(memory), [expected[address] for address in range(64)])
+
+    def test_sparse_memory(self):
+        memory = SparseMemory()
+        memory[(1 << 22) - 1] = 7
+        self.assertEqual(memory[(1 << 22) - 1], 7)
+        self.assertEqual(memory[5], 0)
+        self.assertEqual(len(memory.pages), 1)
+        with self.assertRaises(IndexError):
+            memory[1 << 22] = 1
+        with self.assertRaises(IndexError):
+            memory[-1]
+
+    def test_sparse_memory_partial_page(self):
+        memory = make_memory("sparse", 5000)
+        memory[4100] = 1
+        with self.assertRaises(IndexError):
+            memory[6000] = 7
+        with self.assertRaises(IndexError):
+            memory[5000]
+
+    def test_memory_cells(self):
+        memory = SparseMemory()
+        memory[PAGE_SIZE + 1] = 3
+        cells = list(memory_cells(memory, 0, 1 << 22))
+        self.assertEqual(len(cells), PAGE_SIZE)
+        self.assertEqual(cells[:2], [(PAGE_SIZE, 0), (PAGE_SIZE + 1, 3)])
+        self.assertEqual(list(memory_cells(make_memory("dense", 4), 1, 3)), [(1, 0), (2, 0)])
+
+    def test_sparse_program(self):
+        memory = make_memory("sparse")
+        run(assemble_commands(("LOAD", 4000000, 5), ("WRITE", 4000000, 7)), memory)
+        self.assertEqual(memory[7], 5)
+        with self.assertRaises(IndexError):
+            run(assemble_commands(("LOAD", 4000000, 5)), make_memory())
+
+
+
+class TestSinks(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.memory = make_memory("sparse")
+        for address in range(5):
+            self.memory[address] = address * 10
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def test_result_formats(self):
+        write_result(self.memory, self.path("res.yaml"), (1, 4))
+        with open(self.path("res.yaml")) as f:
+            self.assertEqual(yaml.safe_load(f), [{"Address": 1, "Value": 10}, {"Address": 2, "Value": 20},
+                                                 {"Address": 3, "Value": 30}])
+        write_result(self.memory, self.path("res.csv"), (1, 4))
+        with open(self.path("res.csv"), newline="") as f:
+            self.assertEqual(list(csv.reader(f)), [["Address", "Value"], ["1", "10"], ["2", "20"], ["3", "30"]])
+        write_result(self.memory, self.path("res.out"), (3, 6), "bin")
+        with open(self.path("res.out"), "rb") as f:
+            self.assertEqual(struct.unpack("<3q", f.read()), (30, 40, 0))
+
+    def test_npy(self):
+        write_result(self.memory, self.path("res.npy"), (0, PAGE_SIZE * 3))
+        with open(self.path("res.npy"), "rb") as f:
+            data = f.read()
+        self.assertEqual(data[:6], b"\x93NUMPY")
+        header_size = struct.unpack("<H", data[8:10])[0]
+        self.assertEqual(eval(data[10:10 + header_size]),
+                         {"descr": "<i8", "fortran_order": False, "shape": (PAGE_SIZE * 3,)})
+        self.assertEqual((10 + header_size) % 64, 0)
+        values = struct.unpack(f"<{PAGE_SIZE * 3}q", data[10 + header_size:])
+        self.assertEqual(values[:6], (0, 10, 20, 30, 40, 0))
+        self.assertFalse(any(values[6:]))
+
+    def test_log_formats(self):
+        assemble("program.txt", self.path("out.bin"), self.path("log.npy"))
+        with open(self.path("log.npy"), "rb") as f:
+            data = f.read()
+        self.assertIn(b"'shape': (16, 3)", data[:128])
+        self.assertEqual(struct.unpack("<3q", data[128:152]), (86, 0, 1))
+        log_assembly("program.txt", self.path("log.txt"), "csv")
+        with open(self.path("log.txt"), newline="") as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[0], ["Command", "Operand_B", "Operand_C"])
+        self.assertEqual(rows[-1], ["BITREV", "17", "7"])
+        with open_sink(self.path("empty.yaml"), ("Address", "Value")):
+            pass
+        with open(self.path("empty.yaml")) as f:
+            self.assertEqual(yaml.safe_load(f), [])
+
+
+class TestJit(unittest.TestCase):
+    def test_differential(self):
+        rng = random.Random(16)
+        for _ in range(30):
+            binary_data = random_program(rng, 500, 64)
+            for model in ("dense", "sparse"):
+                for memory_size in (64, None):
+                    expected = make_memory(model, memory_size)
+                    actual = make_memory(model, memory_size)
+                    run(binary_data, expected, width=7)
+                    run_compiled(binary_data, actual, width=7)
+                    self.assertEqual(list(memory_cells(actual, 0, 64)), list(memory_cells(expected, 0, 64)))
+            expected, actual = [0] * 64, [0] * 64
+            run(binary_data, expected)
+            run_compiled(binary_data, actual)
+            self.assertEqual(actual, expected)
+
+    def test_fused_load_out_of_range(self):
+        binary_data = assemble_commands(("LOAD", 62, 1), ("LOAD", 63, 2), ("LOAD", 64, 3))
+        memory = make_memory("dense", 64)
+        with self.assertRaises(IndexError):
+            run_compiled(binary_data, memory)
+        self.assertEqual(len(memory), 64)
+        self.assertEqual(list(memory[62:]), [1, 2])
+
+    def test_disk_cache(self):
+        binary_data = random_program(random.Random(5), 500, 64)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            for model in ("dense", "list", "sparse"):
+                expected = [0] * 64 if model == "list" else make_memory(model, 64)
+                run(binary_data, expected)
+                for _ in range(2):
+                    # Второй проход читает код из каталога, как новый процесс
+                    cache.clear()
+                    actual = [0] * 64 if model == "list" else make_memory(model, 64)
+                    run_compiled(binary_data, actual, cache_dir=cache_dir)
+                    self.assertEqual(list(memory_cells(actual, 0, 64)), list(memory_cells(expected, 0, 64)))
+            self.assertEqual(len(os.listdir(cache_dir)), 3)
+
+    def test_cache_size_limit(self):
+        code_cache = CodeCache(max_size=100)
+        for key in range(5):
+            code_cache.add(key, [], 40)
+        self.assertEqual(list(code_cache.windows), [3, 4])
+        self.assertEqual(code_cache.size, 80)
+
+
+class TestBatch(unittest.TestCase):
+    def test_batch_matches_interpret(self):
+        rng = random.Random(3)
+        with tempfile.TemporaryDirectory() as tmp:
+            programs = os.path.join(tmp, "programs")
+            os.mkdir(programs)
+            for i in range(5):
+                with open(os.path.join(programs, f"p{i}.txt"), "w") as f:
+                    for _ in range(50):
+                        f.write(f"{rng.choice(list(COMMANDS))} {rng.randrange(32)} {rng.randrange(32)}\n")
+            with open(os.path.join(programs, "bad.txt"), "w") as f:
+                f.write("JUMP 1 2\n")
+            paths = find_programs(programs)
+
+            expected = {}
+            for path in paths[1:]:
+                name = os.path.splitext(os.path.basename(path))[0]
+                assemble(path, os.path.join(tmp, "out.bin"))
+                interpret(os.path.join(tmp, "out.bin"), os.path.join(tmp, "res.csv"), (0, 16))
+                with open(os.path.join(tmp, "res.csv"), newline="") as f:
+                    expected[name] = [int(row["Value"]) for row in csv.DictReader(f)]
+
+            result = os.path.join(tmp, "batch.csv")
+            self.assertEqual(run_batch(paths, result, (0, 16), workers=2), ["bad"])
+            actual = {}
+            with open(result, newline="") as f:
+                for row in csv.DictReader(f):
+                    actual.setdefault(row["Program"], []).append(int(row["Value"]))
+            self.assertEqual(actual, expected)
+
+            result = os.path.join(tmp, "batch.bin")
+            run_batch(paths[1:], result, (0, 16), workers=2)
+            with open(result, "rb") as f:
+                values = struct.unpack("<80q", f.read())
+            self.assertEqual(list(values), [value for name in sorted(expected) for value in expected[name]])
+
+    def test_batch_os_error(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            # Каталог с именем программы: открыть его как файл нельзя
+            os.mkdir(os.path.join(tmp, "broken.txt"))
+            with open(os.path.join(tmp, "good.txt"), "w") as f:
+                f.write("LOAD 1 5\n")
+            result = os.path.join(tmp, "batch.csv")
+            with patch("sys.stderr", new_callable=StringIO) as stderr:
+                failed = run_batch(find_programs(tmp), result, (0, 2), workers=2)
+            self.assertEqual(failed, ["broken"])
+            self.assertIn("broken: error:", stderr.getvalue())
+            with open(result, newline="") as f:
+                self.assertEqual([row["Value"] for row in csv.DictReader(f)], ["0", "5"])
+
+
 if __name__ == "__main__":
     unittest.main()